@@ -14,7 +14,6 @@
 # ******************************************************************************
 # Import Python modules
 # ******************************************************************************
-# from whitebox_workflows import WbEnvironment
 import rasterio.mask
 import numpy as np
 import geopandas as gpd
@@ -22,37 +21,12 @@ import os
 import sys
 import glob
 import re
-from rasterio.features import shapes
-from rasterio.mask import mask
-from pandas import DataFrame
-from geopandas import GeoDataFrame
-from shapely.geometry import shape
-import importlib.util
-
-# ******************************************************************************
-# Import WBT for clumping algorithm
-# ******************************************************************************
-# Define path to the whitebox_tools.py file inside the /WBT/
-wbt_path = os.path.join(os.path.dirname(__file__), '../WBT/whitebox_tools.py')
-
-# Check if path to whitebox_tools.py exists
-if not os.path.isfile(wbt_path):
-    raise FileNotFoundError(f"Could not find 'whitebox_tools.py' at {wbt_path}")
-
-# Import whitebox_tools module
-spec = importlib.util.spec_from_file_location("whitebox_tools", wbt_path)
-whitebox_tools = importlib.util.module_from_spec(spec)
-sys.modules["whitebox_tools"] = whitebox_tools
-spec.loader.exec_module(whitebox_tools)
-
-# Initialize WhiteboxTools
-wbt = whitebox_tools.WhiteboxTools()
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-wbt.work_dir = project_root
-wbt.set_verbose_mode(True)
-
-from whitebox_workflows import WbEnvironment
-wbe = WbEnvironment()
+from rasterio.mask import raster_geometry_mask
+from label_utils import clump_labels, clump_labels_tiled, clump_polygons
+from reclass_utils import CLUMP_MAP, WATER_VALS, reclass_lut, \
+    contains_values, reclass_raster
+from river_utils import node_arrays, node_pixels, select_labels
+from script_utils import get_opts
 
 
 # ******************************************************************************
@@ -62,20 +36,35 @@ wbe = WbEnvironment()
 # 2 - voronoi_in
 # 3 - utm_str
 # 4 - clump_out
+# Optional:
+# --block-size N - clump blocks of N x N pixels and merge them across block
+#                  seams, instead of the whole raster at once (default off)
+# --workers N - number of worker processes clumping blocks (default 1)
+# --nodes FILE - shapefile of SWORD nodes; if given, only clumps under or
+#                nearest to nodes are converted into polygons (default none)
+# --max-dist M - search distance (m) for the clump nearest to a node
+#                (default none)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
+args, opts = get_opts(sys.argv, {'block_size': 0, 'workers': 1,
+                                'nodes': None, 'max_dist': 0.0})
+
+IS_arg = len(args)
 if IS_arg != 5:
     print('ERROR - 4 arguments must be used')
     raise SystemExit(22)
 
-tif_in = sys.argv[1]
-voronoi_in = sys.argv[2]
-utm_str = sys.argv[3]
-clump_out = sys.argv[4]
+tif_in = args[1]
+voronoi_in = args[2]
+utm_str = args[3]
+clump_out = args[4]
+block_size = opts['block_size']
+workers = opts['workers']
+nodes_in = opts['nodes']
+max_dist = opts['max_dist']
 
 
 # ******************************************************************************
@@ -95,6 +84,14 @@ except IOError:
     print('ERROR - Unable to open ' + voronoi_in)
     raise SystemExit(22)
 
+if nodes_in is not None:
+    try:
+        with open(nodes_in) as file:
+            pass
+    except IOError:
+        print('ERROR - Unable to open ' + nodes_in)
+        raise SystemExit(22)
+
 
 # ******************************************************************************
 # Retrieve unique months from merged tiles
@@ -115,18 +112,14 @@ print('Reclassifying tif values')
 # Set chunk size
 chunk_size = 5000
 
-# Define pixel reclassification
-reclass_map = {
-    0: 0,  # No data
-    1: 1,  # Open Water
-    2: 1,  # Partial Surface Water
-    252: 252,  # Snow/Ice
-    253: 0,  # Cloud/Cloud shadow
-    255: 0  # No Data
-}
+# Define pixel reclassification (0, 1, 2, 252, 253, 255 to 0, 1, 1, 252, 0, 0)
+reclass_map = CLUMP_MAP
+
+# Create lookup table from the reclassification map
+lookup = reclass_lut(reclass_map)
 
 # Set original water values
-water_val = [1, 2]
+water_val = WATER_VALS
 
 # Initialize valid mon_yrs
 val_mon_yrs = []
@@ -143,39 +136,15 @@ for i in range(len(tif_files)):
     # Reclassify OPERA DSWx
     with rasterio.open(tif_files[i]) as src:
 
-        # Read profile and array
-        profile = src.profile
-        data = src.read()
-
-        # Add compression to raster
-        profile.update({
-            'compress': 'LZW'
-        })
-
         # Check if raster has any water pixels
-        if np.sum(np.isin(data, water_val)) > 0:
+        if contains_values(src, water_val, chunk_size):
 
             # Add mon_yr to new list
             val_mon_yrs.append(mon_yrs[i])
 
-            # Create output raster
-            with rasterio.open(fp_reclass, 'w', **profile) as dst:
-                for j in range(0, src.height, chunk_size):
-
-                    # print(j)
-
-                    # Read a horizontal chunk of data
-                    window = rasterio.windows.Window(0, j, src.width,
-                                                     min(chunk_size,
-                                                         src.height - j))
-                    array = src.read(window=window)
-
-                    # Reclassify pixel values
-                    vector_reclass = np.vectorize(reclass_map.get)
-                    array_reclass = vector_reclass(array)
-
-                    # Write the reclassified chunk to the output file
-                    dst.write(array_reclass, window=window)
+            # Reclassify raster by chunks and write it with compression
+            reclass_raster(src, fp_reclass, lookup, chunk_size,
+                           {'compress': 'LZW'})
 
         # If no water pixels, skip to next file
         else:
@@ -194,6 +163,11 @@ thiessen_polygons = gpd.read_file(voronoi_in)
 poly_shapes = [feature["geometry"] for feature in
                thiessen_polygons.__geo_interface__["features"]]
 
+# Retrieve node coordinates if only clumps near nodes are converted
+if nodes_in is not None:
+    nodes = gpd.read_file(nodes_in)
+    node_xy, _ = node_arrays(nodes)
+
 for i in range(len(val_mon_yrs)):
 
     print(i)
@@ -202,47 +176,39 @@ for i in range(len(val_mon_yrs)):
     fp_reclass = clump_out + 'reclass/opera_' + utm_str + '_' +                \
         val_mon_yrs[i] + '_reclassified.tif'
 
-    # Generate clumped raster fp
-    fp_clump = clump_out + 'clumpedras_poly/opera_' + utm_str + '_' +          \
-        val_mon_yrs[i] + '_clumpedRas.tif'
-    fp_clip = clump_out + 'clumpedras_poly/opera_' + utm_str + '_' +           \
-        val_mon_yrs[i] + '_clumpedRas_clip.tif'
+    # Generate clumped polygon fp
     fp_shp = clump_out + 'clumpedras_poly/opera_' + utm_str + '_' +            \
         val_mon_yrs[i] + '_clumpedRas_poly.shp'
 
-    # Use the clump tool to create regions
-    wbt.clump(fp_reclass, fp_clump, diag=True, zero_back=True)
+    with rasterio.open(fp_reclass) as src:
 
-    # Clip clumped raster to thiessen polygons
-    with rasterio.open(fp_clump) as src:
+        # Clump regions of equal values, either whole in memory or by blocks
+        # into a memory-mapped temporary file
+        if block_size > 0:
+            clump_data = clump_labels_tiled(fp_reclass, block_size, workers)
+        else:
+            clump_data = clump_labels(src.read(1))
 
-        clip_image, clip_transform = mask(src, poly_shapes, crop=True)
+        # Retrieve mask and window of thiessen polygons within the raster
+        clip_mask, clip_transform, clip_window = \
+            raster_geometry_mask(src, poly_shapes, crop=True)
+        clip_crs = src.crs
 
-        # Update raster metadata
-        clip_meta = src.meta.copy()
-        clip_meta.update({
-            "driver": "GTiff",
-            "height": clip_image.shape[1],
-            "width": clip_image.shape[2],
-            "transform": clip_transform,
-            "compress": "LZW"
-        })
+    # Clip clumped raster to thiessen polygons
+    data = np.ma.masked_array(clump_data[clip_window.toslices()],
+                              mask=clip_mask)
 
-        # Write clipped raster to file
-        with rasterio.open(fp_clip, "w", **clip_meta) as dest:
-            dest.write(clip_image)
+    # Mask clumps other than those under or nearest to nodes, measured to
+    # pixel squares as CreatingMainRiver.py measures to clumped polygons
+    if nodes_in is not None:
+        rows, cols = node_pixels(node_xy, clip_transform)
+        near_labels = select_labels(data.filled(0), rows, cols,
+                                    max_dist / clip_transform.a, squares=True)
+        data.mask |= ~np.isin(data.data, near_labels)
 
     # Convert the raster into polygons
-    with rasterio.open(fp_clip) as src:
-        data = src.read(1, masked=True)
-        shape_gen = ((shape(s), v) for s, v in shapes(data,
-                                                      transform=src.transform))
-        df = DataFrame(shape_gen, columns=['geometry', 'class'])
-        df = df.loc[df['class'] != 0]
-        gdf = GeoDataFrame(df['class'], geometry=df.geometry, crs=src.crs)
-        gdf.to_file(fp_shp,
-                    driver='ESRI Shapefile')
-
-    # Delete clumped and clipped raster to save space
-    os.remove(fp_clump)
-    os.remove(fp_clip)
+    gdf = clump_polygons(data, clip_transform, clip_crs)
+    if len(gdf) == 0:
+        print('No clumps near nodes, writing empty polygon file')
+    gdf.to_file(fp_shp,
+                driver='ESRI Shapefile')
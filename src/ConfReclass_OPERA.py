@@ -19,6 +19,7 @@ import numpy as np
 import os
 import sys
 import glob
+from reclass_utils import reclass_lut, reclass_raster
 
 
 # ******************************************************************************
@@ -114,28 +115,13 @@ elif pw_opt == 'agg':
     }
 
 # Create lookup array from the reclassification mapping
-max_key = max(reclass_map.keys())
-lookup = np.zeros(max_key + 1, dtype=np.uint8)
-for k, v in reclass_map.items():
-    lookup[k] = v
+lookup = reclass_lut(reclass_map)
 
 # Loop through rasters
 for i in range(len(tif_files)):
 
     print(i)
 
-    # Open the source raster
+    # Reclassify the source raster by chunks using the lookup array
     with rasterio.open(tif_files[i]) as src:
-
-        # Read profile
-        profile = src.profile
-
-        # Read array
-        data = src.read(1)
-
-        # Reclassify using the lookup array
-        data_reclass = lookup[data]
-
-        # Write the reclassified data to the output raster
-        with rasterio.open(tif_fps[i], 'w', **profile) as dst:
-            dst.write(data_reclass, indexes=1)
+        reclass_raster(src, tif_fps[i], lookup)
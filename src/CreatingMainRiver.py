@@ -22,9 +22,13 @@ import sys
 import fiona
 import rasterio.mask
 import numpy as np
-from rtree import index
-from rasterio.mask import mask
-from shapely.geometry import box
+from rasterio.mask import raster_geometry_mask
+from rasterio.windows import transform as window_transform
+from label_utils import clump_labels
+from reclass_utils import RIVER_MAP, reclass_lut, reclass_raster
+from river_utils import node_arrays, node_pixels, select_labels, \
+    nearest_polygons, connected_water, grid_window
+from script_utils import get_opts
 
 
 # ******************************************************************************
@@ -36,22 +40,39 @@ from shapely.geometry import box
 # 4 - tif_in
 # 5 - utm_str
 # 6 - conwater_out
+# Optional:
+# --raster - select clumps under or nearest to nodes from clumped rasters
+#            instead of clumped polygons (default off)
+# --max-dist M - search distance (m) for the clump nearest to a node in raster
+#                mode (default none)
+# --debug - also write connected water (con_ras) and reclassified (con_reclass)
+#           rasters (default off)
+# --bbox-nearest - select the nearest of the clumped polygons whose bounding
+#                  box is nearest to a node, as in published outputs, instead
+#                  of the polygon nearest to it (default off)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
+args, opts = get_opts(sys.argv, {'raster': False, 'max_dist': 0.0,
+                                'debug': False, 'bbox_nearest': False})
+
+IS_arg = len(args)
 if IS_arg != 7:
     print('ERROR - 6 arguments must be used')
     raise SystemExit(22)
 
-clump_in = sys.argv[1]
-voronoi_in = sys.argv[2]
-nodes_in = sys.argv[3]
-tif_in = sys.argv[4]
-utm_str = sys.argv[5]
-conwater_out = sys.argv[6]
+clump_in = args[1]
+voronoi_in = args[2]
+nodes_in = args[3]
+tif_in = args[4]
+utm_str = args[5]
+conwater_out = args[6]
+raster = opts['raster']
+max_dist = opts['max_dist']
+debug = opts['debug']
+bbox_nearest = opts['bbox_nearest']
 
 
 # ******************************************************************************
@@ -101,23 +122,6 @@ clump_files = sorted(list(glob.iglob(clump_in + 'clumpedras_poly/*' + utm_str +
                                      '*.shp')))
 
 
-# ******************************************************************************
-# Create function for identifying nearest polygon to each node
-# ******************************************************************************
-def near_poly(node_geom):
-
-    # Intersect node geometry with bounding boxes
-    int_index = list(poly_idx.nearest(node_geom.bounds, 1))
-
-    # Retrieve matching polygons
-    int_poly = clipped_poly.iloc[int_index]
-
-    # Calculate the actual distance to these polygons
-    near_poly_index = int_poly.distance(node_geom).idxmin()
-
-    return near_poly_index
-
-
 # ******************************************************************************
 # Create main river from clumped polygons
 # ******************************************************************************
@@ -126,55 +130,96 @@ print('Creating main river')
 # Load SWORD target nodes
 nodes = gpd.read_file(nodes_in)
 
+# Retrieve node coordinates and geometries once for all windows
+node_xy, node_geoms = node_arrays(nodes)
+
+# Retrieve thiessen polygon geometries for raster mode
+if raster:
+    poly_shapes = list(gpd.read_file(voronoi_in).geometry)
+
 for i in range(len(mon_yrs)):
 
     print(i)
 
+    # Set file paths
+    reclassify_fp = clump_in + 'reclass/opera_' + utm_str + '_' + mon_yrs[i] + \
+        '_reclassified.tif'
+
+    conwater_ras_fp = conwater_out + 'con_ras/opera_' + utm_str + '_' +        \
+        mon_yrs[i] + '_connected_water_raster.tif'
+
     # **************************************************************************
-    # Dissolve clumped polygons related to target nodes
+    # Select clumps related to target nodes in raster mode
     # **************************************************************************
-    # Read in clipped clumped OPERA shapefile
-    clipped_poly = gpd.read_file(clump_files[i])
+    if raster:
 
-    # Create spatial index for polygons
-    poly_idx = index.Index()
-    for j, poly in enumerate(clipped_poly.geometry):
-        poly_idx.insert(j, poly.bounds)
+        with rasterio.open(reclassify_fp) as src:
+            data = src.read(1)
+            out_meta = src.meta
 
-    # Find nearest clipped polygon to each node
-    nodes_poly = nodes.copy()
-    nodes_poly['near_poly'] = nodes.geometry.apply(near_poly)
+            # Clump reclassified raster and clip clumps to thiessen polygons
+            labels = clump_labels(data)
+            outside, _, _ = raster_geometry_mask(src, poly_shapes)
+            labels[outside] = 0
 
-    # Select unique reach values
-    near_poly_uniq = list(set(nodes_poly.near_poly.to_list()))
+            # Select clumps under or nearest to each node
+            rows, cols = node_pixels(node_xy, src.transform)
+            near_labels = select_labels(labels, rows, cols,
+                                        max_dist / src.res[0])
 
-    # Dissolve clumped OPERA polygons
-    clipped_poly['ind'] = 0
-    clipped_poly_sub = clipped_poly.loc[near_poly_uniq]
-    conwater = clipped_poly_sub.dissolve(by='ind')
+            # Retrieve OPERA raster data for selected clumps
+            con_data, con_window = connected_water(data, labels, near_labels)
+            out_image = con_data[np.newaxis]
+            out_transform = window_transform(con_window, src.transform)
 
     # **************************************************************************
-    # Retrieve main river tif values
+    # Dissolve clumped polygons related to target nodes
     # **************************************************************************
-    # Set file paths
-    reclassify_fp = clump_in + 'reclass/opera_' + utm_str + '_' + mon_yrs[i] + \
-        '_reclassified.tif'
+    else:
 
-    conwater_ras_fp = conwater_out + 'con_ras/opera_' + utm_str + '_' +        \
-        mon_yrs[i] + '_connected_water_raster.tif'
+        # Read in clipped clumped OPERA shapefile
+        clipped_poly = gpd.read_file(clump_files[i])
+
+        # If no clump was kept near nodes (Clump.py --nodes), set connected
+        # water to 0 over the whole raster, as in raster mode
+        if len(clipped_poly) == 0:
+            with rasterio.open(reclassify_fp) as src:
+                out_image = np.zeros((1, src.height, src.width),
+                                     dtype=src.dtypes[0])
+                out_transform = src.transform
+                out_meta = src.meta
+
+        else:
 
-    # Retrieve feature geometries from connected water
-    shapes = [feature for feature in conwater['geometry']]
+            # Find nearest clipped polygon to each node with a spatial index
+            near_idx = nearest_polygons(node_geoms,
+                                        clipped_poly.geometry.values,
+                                        bbox_nearest)
 
-    # Retrieve OPERA raster data for main river polygon
-    with rasterio.open(reclassify_fp) as src:
-        src_crs = src.crs
-        out_image, out_transform = rasterio.mask.mask(src, shapes, crop=True)
-        out_meta = src.meta
+            # Select unique reach values
+            near_poly_uniq = list(clipped_poly.index[np.unique(near_idx)])
 
-        # Set No data values (255) to 0
-        out_image[out_image == 255] = 0
+            # Dissolve clumped OPERA polygons
+            clipped_poly['ind'] = 0
+            clipped_poly_sub = clipped_poly.loc[near_poly_uniq]
+            conwater = clipped_poly_sub.dissolve(by='ind')
 
+            # Retrieve feature geometries from connected water
+            shapes = [feature for feature in conwater['geometry']]
+
+            # Retrieve OPERA raster data for main river polygon
+            with rasterio.open(reclassify_fp) as src:
+                src_crs = src.crs
+                out_image, out_transform = rasterio.mask.mask(src, shapes,
+                                                              crop=True)
+                out_meta = src.meta
+
+                # Set No data values (255) to 0
+                out_image[out_image == 255] = 0
+
+    # **************************************************************************
+    # Retrieve main river tif values
+    # **************************************************************************
     out_meta.update({'driver': 'GTiff',
                      'height': out_image.shape[1],
                      'width': out_image.shape[2],
@@ -182,11 +227,11 @@ for i in range(len(mon_yrs)):
                      'dtype': src.meta['dtype'],
                      'compress': 'lzw'})
 
-    # Write raster to file
-    with rasterio.open(conwater_ras_fp, 'w',
-                       **out_meta) as dest:
-        dest.write(out_image)
-    dest.close()
+    # Write raster to file if requested
+    if debug:
+        with rasterio.open(conwater_ras_fp, 'w',
+                           **out_meta) as dest:
+            dest.write(out_image)
 
     # **************************************************************************
     # Reclassify Tif pixel values
@@ -200,44 +245,18 @@ for i in range(len(mon_yrs)):
     con_reclass = conwater_out + 'con_reclass/opera_' + utm_str + '_' +        \
         mon_yrs[i] + '_connected_reclass.tif'
 
-    # Set reclassification value map
-    reclass_map = {
-        0: 0,  # No data
-        1: 1,  # Open Water
-        2: 3,  # Partial Surface Water (Change value to avoid overlap)
-        252: 252,  # Snow/Ice (Reclassify to Open Water)
-        253: 253,  # Cloud/Cloud shadow
-        255: 255
-    }
+    # Set reclassification value map (0, 1, 2, 252, 253, 255 to 0, 1, 3, 252,
+    # 253, 255)
+    reclass_map = RIVER_MAP
+    lookup = reclass_lut(reclass_map)
 
     # Set chunk size
     chunk_size = 5000
 
-    # Reclassify OPERA DSWx
-    with rasterio.open(tif_fp) as src:
-
-        # Read profile and array
-        profile = src.profile
-        data = src.read()
-
-        # Create output raster
-        with rasterio.open(con_reclass, 'w', **profile) as dst:
-            for j in range(0, src.height, chunk_size):
-
-                print(j)
-
-                # Read a horizontal chunk of data
-                window = rasterio.windows.Window(0, j, src.width,
-                                                 min(chunk_size,
-                                                     src.height - j))
-                array = src.read(window=window)
-
-                # Reclassify pixel values
-                vector_reclass = np.vectorize(reclass_map.get)
-                array_reclass = vector_reclass(array)
-
-                # Write the reclassified chunk to the output file
-                dst.write(array_reclass, window=window)
+    # Reclassify OPERA DSWx by chunks and write to file if requested
+    if debug:
+        with rasterio.open(tif_fp) as src:
+            reclass_raster(src, con_reclass, lookup, chunk_size)
 
     # **************************************************************************
     # Create the main river raster
@@ -254,36 +273,20 @@ for i in range(len(mon_yrs)):
     # 253: Cloud
     # 255: No Data
 
-    # Open rasters
-    with rasterio.open(conwater_ras_fp) as con_r:
-        with rasterio.open(con_reclass) as tif_r:
-
-            # Read data and bounds of connected water rasters
-            con_data = con_r.read(1)
-            con_bounds = con_r.bounds
-            con_geom = [box(*con_bounds)]
-
-            # Clip original raster to connected water raster
-            tif_clip, tif_transform = mask(tif_r, con_geom, crop=True)
-            tif_clip = np.resize(tif_clip[0], con_data.shape)
-            tif_clip = tif_clip.astype(con_data.dtype)
-
-            # Sum rasters
-            sum_data = con_data + tif_clip
-
-            # Update metadata from connected raster
-            out_meta = con_r.meta.copy()
-            out_meta.update({"transform": con_r.transform,
-                             "height": con_data.shape[0],
-                             "width": con_data.shape[1],
-                             "dtype": con_r.meta['dtype'],
-                             "compress": "lzw",
-                             "colormap": tif_r.colormap})
-
-            # Set output filepath
-            mainriver_fp = conwater_out + 'main_river/opera_' + utm_str + '_' +\
-                mon_yrs[i] + '_main_river.tif'
-
-            # Write main river raster to file
-            with rasterio.open(mainriver_fp, 'w', **out_meta) as dst:
-                dst.write(sum_data, 1)
+    # Read and reclassify original raster over connected water window
+    with rasterio.open(tif_fp) as tif_r:
+        tif_window = grid_window(tif_r.transform, out_transform,
+                                 out_image.shape[1:])
+        tif_clip = np.take(lookup, tif_r.read(1, window=tif_window))
+
+    # Sum rasters
+    con_data = out_image[0]
+    sum_data = con_data + tif_clip.astype(con_data.dtype)
+
+    # Set output filepath
+    mainriver_fp = conwater_out + 'main_river/opera_' + utm_str + '_' +        \
+        mon_yrs[i] + '_main_river.tif'
+
+    # Write main river raster to file, with metadata of connected raster
+    with rasterio.open(mainriver_fp, 'w', **out_meta) as dst:
+        dst.write(sum_data, 1)
@@ -18,6 +18,9 @@ import glob
 import numpy as np
 import pandas as pd
 import os
+import pyarrow.dataset as ds
+from script_utils import get_opts
+from width_utils import read_width_store, store_windows
 
 
 # ******************************************************************************
@@ -27,20 +30,26 @@ import os
 # 2 - qual_in
 # 3 - opera_in
 # 4 - comp_out
+# Optional:
+# --parquet - read OPERA widths from a Parquet store in opera_in, partitioned
+#             by start date and UTM zone, instead of csv files (default off)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
+args, opts = get_opts(sys.argv, {'parquet': False})
+
+IS_arg = len(args)
 if IS_arg != 5:
     print('ERROR - 4 arguments must be used')
     raise SystemExit(22)
 
-swot_in = sys.argv[1]
-qual_in = sys.argv[2]
-opera_in = sys.argv[3]
-comp_out = sys.argv[4]
+swot_in = args[1]
+qual_in = args[2]
+opera_in = args[3]
+comp_out = args[4]
+parquet = opts['parquet']
 
 
 # ******************************************************************************
@@ -75,23 +84,33 @@ print('Reading files')
 # ------------------------------------------------------------------------------
 # OPERA
 # ------------------------------------------------------------------------------
-# Get file paths to OPERA width files
-opera_files = sorted(list(glob.iglob(opera_in + '*.csv')))
-
-# Read OPERA widths
-opera_all = [pd.read_csv(i) for i in opera_files]
-
-# Retrieve unique node ids
-node_ids = np.unique(opera_all[0].node_id)
-
-# Retrieve node types
-node_types = opera_all[0].node_id % 10
-type1 = node_types[node_types == 1].index.values
-
-# Retrieve start, middle, and end date of each 2 week OPERA window
-start_dt = [datetime.strptime(i.startdate[0], '%Y-%m-%d') for i in opera_all]
-mid_dt = [datetime.strptime(i.middate[0], '%Y-%m-%d')for i in opera_all]
-end_dt = [datetime.strptime(i.enddate[0], '%Y-%m-%d') for i in opera_all]
+if parquet:
+    # Retrieve start, middle, and end date of each 2 week OPERA window, OPERA
+    # widths of each window being read from the Parquet store when paired
+    windows = store_windows(opera_in)
+    start_dt = [datetime.strptime(i, '%Y-%m-%d') for i in windows.startdate]
+    mid_dt = [datetime.strptime(i, '%Y-%m-%d') for i in windows.middate]
+    end_dt = [datetime.strptime(i, '%Y-%m-%d') for i in windows.enddate]
+
+else:
+    # Get file paths to OPERA width files
+    opera_files = sorted(list(glob.iglob(opera_in + '*.csv')))
+
+    # Read OPERA widths
+    opera_all = [pd.read_csv(i) for i in opera_files]
+
+    # Retrieve unique node ids
+    node_ids = np.unique(opera_all[0].node_id)
+
+    # Retrieve node types
+    node_types = opera_all[0].node_id % 10
+    type1 = node_types[node_types == 1].index.values
+
+    # Retrieve start, middle, and end date of each 2 week OPERA window
+    start_dt = [datetime.strptime(i.startdate[0], '%Y-%m-%d')
+                for i in opera_all]
+    mid_dt = [datetime.strptime(i.middate[0], '%Y-%m-%d')for i in opera_all]
+    end_dt = [datetime.strptime(i.enddate[0], '%Y-%m-%d') for i in opera_all]
 
 # ------------------------------------------------------------------------------
 # SWOT
@@ -155,20 +174,37 @@ swot_df_fil = swot_df_fil[(np.abs(swot_df_fil.xtrk_dist) >= 10000) &
 # ******************************************************************************
 print('Pairing SWOT and OPERA observations')
 # Initialize dataframe
-merged_all = opera_all[0].iloc[0:0]
+if parquet:
+    # No partition has a null start date, so no rows are read
+    merged_all = read_width_store(opera_in,
+                                  row_filter=ds.field('startdate').is_null())
+else:
+    merged_all = opera_all[0].iloc[0:0]
 
 for i in range(len(start_dt)):
 
     print(i)
 
-    # Load OPERA width file
-    opera_i = opera_all[i]
+    if parquet:
+        # Load OPERA widths of window, dropping OPERA nodes with > 20%
+        # no_data_fraction while reading the Parquet store
+        opera_i = read_width_store(
+            opera_in,
+            row_filter=(ds.field('startdate') == windows.startdate[i]) &
+            (ds.field('no_data_frac') < .2))
+
+        # Drop all non-type 1 nodes
+        opera_i = opera_i[opera_i.node_id % 10 == 1]
+
+    else:
+        # Load OPERA width file
+        opera_i = opera_all[i]
 
-    # Drop all non-type 1 nodes
-    opera_i = opera_i.iloc[type1, :]
+        # Drop all non-type 1 nodes
+        opera_i = opera_i.iloc[type1, :]
 
-    # Drop OPERA nodes with > 20% no_data_fraction
-    opera_i = opera_i[opera_i.no_data_frac < .2]
+        # Drop OPERA nodes with > 20% no_data_fraction
+        opera_i = opera_i[opera_i.no_data_frac < .2]
 
     # Retrieve node_ids with valid OPERA widths
     node_ids = np.unique(opera_i.node_id)
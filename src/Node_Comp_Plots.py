@@ -11,6 +11,7 @@
 # ******************************************************************************
 # Import Python modules
 # ******************************************************************************
+import os
 import sys
 import numpy as np
 import pandas as pd
@@ -19,6 +20,8 @@ import matplotlib.pyplot as plt
 import glob
 from matplotlib.colors import LogNorm
 import matplotlib.patches as mpatches
+from script_utils import get_opts
+from width_utils import read_width_store
 
 
 # ******************************************************************************
@@ -28,20 +31,26 @@ import matplotlib.patches as mpatches
 # 2 - swot_in
 # 3 - qual_in
 # 4 - opera_in
+# Optional:
+# --parquet - read OPERA widths from a Parquet store in opera_in, partitioned
+#             by start date and UTM zone, instead of csv files (default off)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
-if IS_arg != 2:
-    print('ERROR - 1 arguments must be used')
+args, opts = get_opts(sys.argv, {'parquet': False})
+
+IS_arg = len(args)
+if IS_arg != 5:
+    print('ERROR - 4 arguments must be used')
     raise SystemExit(22)
 
-comp_in = sys.argv[1]
-swot_in = sys.argv[2]
-qual_in = sys.argv[3]
-opera_in = sys.argv[4]
+comp_in = args[1]
+swot_in = args[2]
+qual_in = args[3]
+opera_in = args[4]
+parquet = opts['parquet']
 
 
 # ******************************************************************************
@@ -69,10 +78,10 @@ except IOError:
     raise SystemExit(22)
 
 try:
-    with open(opera_in) as file:
+    if os.path.isdir(opera_in):
         pass
 except IOError:
-    print('ERROR - Unable to open ' + opera_in)
+    print('ERROR - '+opera_in+' invalid folder path')
     raise SystemExit(22)
 
 
@@ -86,11 +95,17 @@ comp_all = pd.read_csv(comp_in)
 # ------------------------------------------------------------------------------
 # OPERA
 # ------------------------------------------------------------------------------
-# Get file paths to OPERA width files
-opera_files = sorted(list(glob.iglob(opera_in + '*.csv')))
+if parquet:
+    # Read only node ids and no data fractions of OPERA widths of all windows
+    # from the Parquet store, as a single table
+    opera_all = [read_width_store(opera_in, ['node_id', 'no_data_frac'])]
+
+else:
+    # Get file paths to OPERA width files
+    opera_files = sorted(list(glob.iglob(opera_in + '*.csv')))
 
-# Read OPERA widths
-opera_all = [pd.read_csv(i) for i in opera_files]
+    # Read OPERA widths
+    opera_all = [pd.read_csv(i) for i in opera_files]
 
 # Retrieve unique node ids
 node_ids = np.unique(opera_all[0].node_id)
@@ -19,11 +19,11 @@ import glob
 import sys
 import os
 import re
-import pandas as pd
 import rasterio
-from rasterstats import zonal_stats
-from rasterio.warp import reproject, Resampling, calculate_default_transform
-from rasterio.io import MemoryFile
+from pixel_utils import zone_grid, grid_aligned, zone_raster, zone_counts, \
+    count_table, pixel_class_table, file_hash, cached_zone_raster, \
+    cached_zone_table, table_counts
+from script_utils import get_opts
 
 
 # ******************************************************************************
@@ -33,20 +33,28 @@ from rasterio.io import MemoryFile
 # 2 - voronoi_in
 # 3 - utm_str
 # 4 - csv_out
+# Optional:
+# --zone-cache DIR - folder of cached tables of the pixels of each Thiessen
+#                    polygon (.npy), memory-mapped and gathered from main river
+#                    rasters instead of burning the polygons again, and of the
+#                    zone rasters (.tif) they are built from (default none)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
+args, opts = get_opts(sys.argv, {'zone_cache': None})
+
+IS_arg = len(args)
 if IS_arg != 5:
     print('ERROR - 4 arguments must be used')
     raise SystemExit(22)
 
-main_river_in = sys.argv[1]
-voronoi_in = sys.argv[2]
-utm_str = sys.argv[3]
-csv_out = sys.argv[4]
+main_river_in = args[1]
+voronoi_in = args[2]
+utm_str = args[3]
+csv_out = args[4]
+zone_cache = opts['zone_cache']
 
 
 # ******************************************************************************
@@ -66,6 +74,10 @@ except IOError:
     print('ERROR - Unable to open ' + voronoi_in)
     raise SystemExit(22)
 
+if zone_cache is not None and not os.path.isdir(zone_cache):
+    print('ERROR - '+zone_cache+' invalid folder path')
+    raise SystemExit(22)
+
 
 # ******************************************************************************
 # Retrieve unique months from main river files
@@ -81,11 +93,19 @@ mon_yrs = sorted(list(set([re.search(r'(\d{4}-\d{2}-\d{2}_\d{4}-\d{2}-\d{2})',
 thiessen_pols = gpd.read_file(voronoi_in)
 thiessen_pols["Area_Sqkm"] = thiessen_pols['geometry'].area / 10**6
 
+# Hash Thiessen polygon file to retrieve its cached zone rasters
+if zone_cache is not None:
+    voronoi_hash = file_hash(voronoi_in)
+
 
 # ******************************************************************************
 # Calculate pixel class numbers in Thiessen Polygons
 # ******************************************************************************
 print('Calculating pixel class numbers in Thiessen Polygons')
+
+# Initialize grid of Thiessen polygon zones, burned once for the UTM zone
+zone_transform = None
+
 for i in range(len(mon_yrs)):
 
     print(i)
@@ -95,45 +115,34 @@ for i in range(len(mon_yrs)):
         # mainriver_rast = src.read(1)
         # mainriver_trans = src.transform
 
-        # Calculate pixel counts per polygon
-        zs = zonal_stats(vectors=thiessen_pols['geometry'],
-                         raster=src.read(1),
-                         affine=src.transform,
-                         categorical=True, nodata=255)
-    pixel_numbers = pd.DataFrame(zs).fillna(0)
-
-    # Assembly polygons and pixel numbers into dataframe
-    frames = [thiessen_pols, pixel_numbers]
-
-    # Label pixel classes
-    pixel_class = pd.concat(frames, axis=1)
-
-    # Add missing columns
-    req_cols = [0, 1, 2, 3, 4, 252, 253, 255]
-
-    for col in req_cols:
-        if col not in pixel_class.columns:
-            pixel_class[col] = 0
-
-    pixel_class.rename(columns={0: 'Land',
-                                1: 'Unconnected_Open',
-                                2: 'Connected_Open',
-                                3: 'Unconnected_Partial',
-                                4: 'Connected_Partial',
-                                252: 'IceSnow',
-                                253: 'Clouds',
-                                255: 'No_Data'}, inplace=True)
-
-    # Drop columns for output
-    pixel_class = pixel_class.filter(['node_id', 'reach_id', 'node_len',
-                                      'x', 'y', 'Area_Sqkm',
-                                      'Unconnected_Open', 'Unconnected_Partial',
-                                      'Connected_Open', 'Connected_Partial',
-                                      'Land', 'Clouds', 'IceSnow', 'No_Data'])
-
-    # Round floats
-    pixel_class = pixel_class.round({'node_len': 4, 'x': 6, 'y': 6,
-                                     'Area_Sqkm': 6})
+        # Burn Thiessen polygons into a zone raster aligned to the main river
+        # grid, reused by all main river rasters on the same grid, or retrieve
+        # it from the cache
+        if zone_transform is None or \
+                not grid_aligned(zone_transform, src.transform):
+            zone_transform, zone_shape = zone_grid(thiessen_pols.geometry,
+                                                   src.transform)
+            if zone_cache is None:
+                zones = zone_raster(thiessen_pols.geometry, zone_transform,
+                                    zone_shape)
+            else:
+                zone_fp = cached_zone_raster(zone_cache, voronoi_hash,
+                                             thiessen_pols.geometry,
+                                             zone_transform, zone_shape,
+                                             src.crs)
+                zone_tab = cached_zone_table(zone_fp, len(thiessen_pols))
+
+        # Calculate pixel counts per polygon, gathering the pixels of each
+        # polygon from the table of cached zones
+        if zone_cache is None:
+            counts = zone_counts(zones, zone_transform, src.read(1),
+                                 src.transform, len(thiessen_pols))
+        else:
+            counts = table_counts(zone_tab, src.read(1), src.transform)
+        pixel_numbers = count_table(counts)
+
+    # Assemble polygons and pixel numbers into table of pixel classes
+    pixel_class = pixel_class_table(thiessen_pols, pixel_numbers)
 
     # Set file path
     csv_fp = csv_out + 'opera_' + utm_str + '_' + mon_yrs[i] + \
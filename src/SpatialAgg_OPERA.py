@@ -14,7 +14,6 @@
 # ******************************************************************************
 import os
 import glob
-import numpy as np
 import pandas as pd
 import geopandas as gpd
 import sys
@@ -22,9 +21,9 @@ import re
 import glob
 from pyproj import CRS
 from collections import Counter
-import rasterio
-from rasterio.warp import calculate_default_transform, reproject, Resampling
-from rasterio.merge import merge
+from composite_utils import priority_lut
+from merge_utils import window_tiles, merge_window
+from script_utils import get_opts, run_jobs
 
 
 # ******************************************************************************
@@ -34,20 +33,32 @@ from rasterio.merge import merge
 # 2 - tile_in
 # 3 - utm_str
 # 4 - merge_out
+# Optional:
+# --lazy - merge tiles by chunks of output rows without holding reprojected
+#          tiles in memory (default off)
+# --workers N - number of worker processes (default 1)
+# --max-mem MB - address space limit of each process running jobs
+#                (default none)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
+args, opts = get_opts(sys.argv, {'lazy': False, 'workers': 1,
+                                'max_mem': 0})
+
+IS_arg = len(args)
 if IS_arg != 5:
     print('ERROR - 4 arguments must be used')
     raise SystemExit(22)
 
-opera_in = sys.argv[1]
-tile_in = sys.argv[2]
-utm_str = sys.argv[3]
-merge_out = sys.argv[4]
+opera_in = args[1]
+tile_in = args[2]
+utm_str = args[3]
+merge_out = args[4]
+lazy = opts['lazy']
+workers = opts['workers']
+max_mem = opts['max_mem']
 
 
 # ******************************************************************************
@@ -91,26 +102,15 @@ if extent == 1:
 elif extent == 2:
     priority = [0, 2, 1, 252, 253, 255]
 
+# Set number of output rows merged at a time in lazy mode
+chunk_size = 1024
+
 
 # ******************************************************************************
-# Create custom merge function
+# Create priority ranking for custom merge
 # ******************************************************************************
-# Create custom merge function that merges rasters based on value priority
-def priority_merge(old_data, new_data, old_nodata=None, new_nodata=None,
-                   index=None, roff=None, coff=None):
-
-    # Create a priority ranking: lower values in the list have higher priority
-    priority_rank = {val: rank for rank, val in enumerate(priority)}
-
-    # Get the ranks of old and new data based on priority
-    old_data_priority = np.vectorize(priority_rank.get)(old_data)
-    new_data_priority = np.vectorize(priority_rank.get)(new_data)
-
-    # Mask to select where new_data should replace old_data
-    replace_mask = new_data_priority < old_data_priority
-
-    # Update old_data where the new_data has higher priority
-    old_data[replace_mask] = new_data[replace_mask]
+# Create a priority ranking: lower values in the list have higher priority
+priority_rank = priority_lut(priority)
 
 
 # ******************************************************************************
@@ -155,102 +155,29 @@ date_windows = sorted(list(set(opera_dates)))
 # ******************************************************************************
 # Reproject and realign rasters to source raster for each date window
 # ******************************************************************************
-for i in range(len(date_windows)):
-
-    print(i)
-
-    # Select date window
-    window_i = date_windows[i]
-
-    # Retrieve file paths corresponding to window_i
-    sub_files = [fil_files[i] for i, window in enumerate(fil_dates)
-                 if window == window_i]
-
-    # Set filepath corresponding to source raster with target CRS
-    src_in = next((file for file in sub_files
-                   if ('T' + utm_str[0:2]) in file), None)
-
-    # Read source raster (unchanging layer)
-    with rasterio.open(src_in) as src:
-        # Get source CRS, transform, and metadata
-        src_crs = src.crs
-        src_transform = src.transform
-        src_meta = src.meta.copy()
-        src_bounds = src.bounds
-
-    # Create a list to hold reprojected rasters in memory
-    reproj_rasters = []
-
-    # Reproject each raster and store it in MemoryFile
-    for reproj_in in sub_files:
-        with rasterio.open(reproj_in) as reproj:
-            # Get reproj CRS, transform, and metadata
-            reproj_crs = reproj.crs
-            reproj_transform = reproj.transform
-            reproj_meta = reproj.meta.copy()
-            reproj_bounds = reproj.bounds
-
-            # Calculate the transform and dimensions to project to new CRS
-            target_transform, target_width, target_height = \
-                calculate_default_transform(reproj_crs, src_crs,
-                                            reproj.width, reproj.height,
-                                            *reproj_bounds)
-
-            # Align pixel grids to src_in
-            align_transform, align_width, align_height = \
-                rasterio.warp.aligned_target(transform=target_transform,
-                                             width=target_width,
-                                             height=target_height,
-                                             resolution=(src_transform[0],
-                                                         -src_transform[4]))
-
-            # Update metadata for the output raster
-            reproj_args = reproj_meta.copy()
-            reproj_args.update({
-                'crs': src_crs,
-                'transform': align_transform,
-                'width': align_width,
-                'height': align_height
-            })
-
-            # Reproject the data and store it in memory
-            with rasterio.io.MemoryFile() as memfile:
-                with memfile.open(**reproj_args) as dst:
-                    reproject(
-                        source=rasterio.band(reproj, 1),
-                        destination=rasterio.band(dst, 1),
-                        src_transform=reproj_transform,
-                        src_crs=reproj_crs,
-                        dst_transform=align_transform,
-                        dst_crs=src_crs,
-                        resampling=Resampling.nearest
-                    )
-                    # Append reproj_raster
-                    reproj_rasters.append(memfile.open())
-
-    # Merge OPERA tiles with custom priority merge
-    merge_rast, out_trans = merge(reproj_rasters, method=priority_merge)
-
-    # Remove extra dimension if it exists
-    merge_rast = np.squeeze(merge_rast)
-
-    # Get the metadata from the first MemoryFile Object
-    meta = reproj_rasters[0].meta.copy()
-
-    # Update metadata for merged raster
-    meta.update({
-        'height': merge_rast.shape[0],
-        'width': merge_rast.shape[1],
-        'transform': out_trans,
-        'compress': 'LZW'
-    })
+# Retrieve tiles of each date window and the grid they are merged to, with
+# index maps of reprojected tiles held in a temporary folder in merge_out
+grid_tmp, windows = window_tiles(fil_files, fil_dates, date_windows, utm_str,
+                                 merge_out, workers)
+
+# Initialize list of date window merge jobs
+jobs = []
+
+for window_i, (sub_files, src_crs, src_res) in zip(date_windows, windows):
 
     # Set output file path
     merge_fp = merge_out + 'opera_' + utm_str + "_" + window_i + '.tif'
 
-    # Write the merged raster to a file
-    with rasterio.open(merge_fp, 'w', **meta) as dst:
-        dst.write(merge_rast, 1)
+    jobs.append((sub_files, src_crs, src_res, grid_tmp.name, priority_rank,
+                 merge_fp, lazy, chunk_size))
+
+# Merge OPERA tiles for each date window, in lazy mode by chunks of output
+# rows directly to file
+for merge_fp in run_jobs(merge_window, jobs, workers, max_mem):
+    print(os.path.basename(merge_fp))
+
+# Remove index maps of the UTM zone
+grid_tmp.cleanup()
 
 
 # # ******************************************************************************
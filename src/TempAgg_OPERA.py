@@ -16,9 +16,9 @@ import os
 import re
 import sys
 import glob
-import numpy as np
 from datetime import datetime, timedelta
-import rasterio
+from composite_utils import composite_window
+from script_utils import get_opts, run_jobs
 
 
 # ******************************************************************************
@@ -29,21 +29,32 @@ import rasterio
 # 3 - date2
 # 4 - window
 # 5 - tile_out
+# Optional:
+# --workers N - number of worker processes (default 1)
+# --blocks - stream granules through their internal blocks (default off)
+# --resume - skip or update composites using their manifests, which are only
+#            written in this mode (default off)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
+args, opts = get_opts(sys.argv, {'workers': 1, 'blocks': False,
+                                'resume': False})
+
+IS_arg = len(args)
 if IS_arg != 6:
     print('ERROR - 5 arguments must be used')
     raise SystemExit(22)
 
-opera_in = sys.argv[1]
-date1 = sys.argv[2]
-date2 = sys.argv[3]
-window = sys.argv[4]
-tile_out = sys.argv[5]
+opera_in = args[1]
+date1 = args[2]
+date2 = args[3]
+window = args[4]
+tile_out = args[5]
+workers = opts['workers']
+blocks = opts['blocks']
+resume = opts['resume']
 
 
 # ******************************************************************************
@@ -118,13 +129,14 @@ tile_uniq = sorted(list(set(tile_num)))
 
 
 # ******************************************************************************
-# For each unique tile, composite OPERA files across date windows
+# For each unique tile, retrieve OPERA files across date windows
 # ******************************************************************************
+# Initialize list of (tile, window) composite jobs
+jobs = []
+
 # Loop through unique OPERA tiles
 for i in range(len(tile_uniq)):
 
-    print(i)
-
     # Retrieve tile of interest
     tile_i = tile_uniq[i]
 
@@ -136,7 +148,7 @@ for i in range(len(tile_uniq)):
     file_dates = [datetime.strptime(re.search(r'(\d{8})T', x).group(1),
                                     '%Y%m%d') for x in tile_files]
 
-    # Loop through date windows, aggregating OPERA files for each window
+    # Loop through date windows, retrieving OPERA files for each window
     for k in range(len(date_window)):
 
         # Select date window
@@ -150,76 +162,18 @@ for i in range(len(tile_uniq)):
         if len(sub_files) == 0:
             continue
 
-        # Set variable to catch first file of each tile
-        firstfile = 1
-
-        # Loop through OPERA files
-        for j in range(len(sub_files)):
-
-            # If first file found for tile
-            if firstfile == 1:
-
-                # Open the raster file, extract metadata and raster values
-                with rasterio.open(sub_files[j]) as src:
-                    info = src.profile
-                    A = src.read()  # A is the raster data
-                    R = src.transform  # R is the affine transformation
-
-                # Create array for value remapping
-                B = np.zeros_like(A)
-
-                # Remap OPERA values based on priority list
-                for p in range(len(priority)):
-                    B[A == priority[p]] = p
-
-                # Store composite data
-                composite = {'A': B, 'R': R}
-
-                # Reset firstfile value
-                firstfile = 0
-
-            # If not the first file found for tile
-            else:
-
-                # Open the raster file
-                with rasterio.open(sub_files[j]) as src:
-                    A = src.read()  # A is the raster data
-
-                # Create array for value remapping
-                B = np.zeros_like(A)
-
-                # Remap OPERA values based on priority list
-                for p in range(len(priority)):
-                    B[A == priority[p]] = p
-
-                # Replace values in A with value in B when A > B
-                composite['A'] = np.where(composite['A'] > B, B, composite['A'])
-
-        # Map priority values back to original classes
-        composite['A'] = np.array(priority)[composite['A']]
-
-        # # Remap ice to open water if option selected
-        # if icewater == 1:
-        #     composite['A'][composite['A'] == 252] = 1
-
-        # **********************************************************************
-        # Write composited OPERA data to file
-        # **********************************************************************
         # Prepare output filepath
         out_fp = tile_out + 'opera_T' + tile_i + '_' +                         \
             window_i[0].strftime('%Y-%m-%d') + '_' +                           \
             window_i[1].strftime('%Y-%m-%d') + '.tif'
 
-        # Compress data to appropriate shape
-        data_out = composite['A'].squeeze()
-
-        # Write composite tif to file
-        with rasterio.open(out_fp, 'w', driver='GTiff', dtype=info['dtype'],
-                           nodata=info['nodata'], height=info['height'],
-                           width=info['width'], count=1, crs=info['crs'],
-                           transform=info['transform'],
-                           blockxsize=info['blockxsize'],
-                           blockysize=info['blockysize'],
-                           tiled=info['tiled'], compress=info['compress'],
-                           interleave=info['interleave']) as dst:
-            dst.write(data_out, 1)
+        jobs.append((sub_files, out_fp, priority, blocks, resume))
+
+
+# ******************************************************************************
+# Composite OPERA files for each tile and date window
+# ******************************************************************************
+# Jobs are independent and may be sent to a pool of worker processes; results
+# are returned in job order
+for out_fp, status in run_jobs(composite_window, jobs, workers):
+    print(os.path.basename(out_fp) + ' ' + status)
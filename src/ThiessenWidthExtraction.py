@@ -15,11 +15,13 @@
 # Import Python modules
 # ******************************************************************************
 import pandas as pd
+import numpy as np
 import glob
 import sys
-import re
 import os
-from datetime import datetime
+from script_utils import get_opts
+from width_utils import file_window, window_midpoint, width_table, \
+    write_width_store
 
 
 # ******************************************************************************
@@ -28,19 +30,29 @@ from datetime import datetime
 # 1 - pixel_num_in
 # 2 - tif_opt
 # 3 - width_out
+# Optional:
+# --batch - read the pixel counts of all date windows at once and write the
+#           widths of all windows to a single file for the UTM zone
+#           (default off)
+# --parquet - write widths to a Parquet store in width_out, partitioned by
+#             start date and UTM zone, instead of csv files (default off)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
+args, opts = get_opts(sys.argv, {'batch': False, 'parquet': False})
+
+IS_arg = len(args)
 if IS_arg != 4:
     print('ERROR - 3 arguments must be used')
     raise SystemExit(22)
 
-pixel_num_in = sys.argv[1]
-utm_str = sys.argv[2]
-width_out = sys.argv[3]
+pixel_num_in = args[1]
+utm_str = args[2]
+width_out = args[3]
+batch = opts['batch']
+parquet = opts['parquet']
 
 
 # ******************************************************************************
@@ -61,18 +73,10 @@ except IOError:
 pixel_files = sorted(list(glob.iglob(pixel_num_in + '*' + utm_str + '*')))
 
 # Retrieve unique aggregation dates
-mon_yrs = sorted(list(set([re.search(r'(\d{4}-\d{2}-\d{2}_\d{4}-\d{2}-\d{2})',
-                                     x).group(1) for x in pixel_files])))
+mon_yrs = sorted(list(set([file_window(x) for x in pixel_files])))
 
 # Retrieve midpoint date between start and end
-midpoints = []
-
-for dr in mon_yrs:
-    start_date_str, end_date_str = dr.split('_')
-    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-    midpoint = start_date + (end_date - start_date) / 2
-    midpoints.append(midpoint.strftime('%Y-%m-%d'))
+midpoints = [window_midpoint(dr) for dr in mon_yrs]
 
 
 # ******************************************************************************
@@ -80,64 +84,51 @@ for dr in mon_yrs:
 # ******************************************************************************
 print('Extracting river widths for each node')
 
-for i in range(len(mon_yrs)):
-
-    print(i)
-
-    # Read thiessen polygon table
-    pixtable = pd.read_csv(pixel_files[i])
-
-    # Create new dataframe for widths
-    widtable = pd.DataFrame({'node_id': pixtable.node_id,
-                             'reach_id': pixtable.reach_id,
-                             'startdate': [mon_yrs[i].split('_')[0]] *
-                            len(pixtable),
-                             'middate': midpoints[i],
-                             'enddate': [mon_yrs[i].split('_')[1]] *
-                            len(pixtable),
-                             'node_len': pixtable.node_len,
-                             'x': pixtable.x,
-                             'y': pixtable.y,
-                             'poly_area_km2': pixtable.Area_Sqkm,
-                             'open_con': pixtable.Connected_Open,
-                             'open_uncon': pixtable.Unconnected_Open,
-                             'partial_con': pixtable.Connected_Partial,
-                             'partial_uncon': pixtable.Unconnected_Partial,
-                             'land': pixtable.Land,
-                             'cloud': pixtable.Clouds,
-                             'icesnow': pixtable.IceSnow,
-                             'no_data': pixtable.No_Data})
-
-    # Convert connected pixel count to area in m2
-    # Partially inundated pixels counted as half area
-    open_area = widtable.open_con * 900  # Fully inundated area
-    partial_area = widtable.partial_con * 900  # Partially inundated area
-
-    # Calculate river width in meters at node, node_len in meters
-    widtable['width_m'] = (open_area + (0.5 * partial_area)) /\
-        widtable.node_len
-
-    # Calculate fraction of polygon with no data/clouds
-    widtable['no_data_frac'] = ((widtable['no_data'] + widtable['cloud']) /
-                                (widtable['open_con'] +
-                                 widtable['open_uncon'] +
-                                 widtable['partial_con'] +
-                                 widtable['partial_uncon'] +
-                                 widtable['land'] +
-                                 widtable['cloud'] +
-                                 widtable['icesnow'] +
-                                 widtable['no_data']))
-
-    # Calculate polygon inundation fraction of each polygon
-    widtable['inun_frac'] = (open_area + (0.5 * partial_area)) /\
-        (widtable.poly_area_km2 * 1000000)
-
-    # Round floats
-    widtable = widtable.round({'width_m': 4, 'no_data_frac': 4, 'inun_frac': 4})
-
-    # Set output filepath
-    csv_fp = width_out + 'opera_' + utm_str + '_' + mon_yrs[i] + \
-        '_river_width.csv'
-
-    # Write width table to csv
-    widtable.to_csv(csv_fp, index=False)
+if batch:
+
+    # Read pixel count tables of all windows, with the window of each row
+    # retrieved from the name of its file
+    # Pixel counts keep the types read from each file, as in the widths of
+    # each window, and columns read as floats from any window are floats
+    pixtables = [pd.read_csv(x) for x in pixel_files]
+    pixtable = pd.concat(pixtables, ignore_index=True)
+    win = np.repeat([mon_yrs.index(file_window(x)) for x in pixel_files],
+                    [len(x) for x in pixtables])
+
+    # Calculate widths of all windows at once
+    startdates = np.array([x.split('_')[0] for x in mon_yrs])
+    enddates = np.array([x.split('_')[1] for x in mon_yrs])
+    widtable = width_table(pixtable, startdates[win],
+                           np.array(midpoints)[win], enddates[win])
+
+    # Write width table of all windows to Parquet store or csv
+    if parquet:
+        write_width_store(widtable, width_out, utm_str)
+    else:
+        csv_fp = width_out + 'opera_' + utm_str + '_river_width.csv'
+        widtable.to_csv(csv_fp, index=False)
+
+else:
+
+    for i in range(len(mon_yrs)):
+
+        print(i)
+
+        # Read thiessen polygon table
+        pixtable = pd.read_csv(pixel_files[i])
+
+        # Calculate widths
+        widtable = width_table(pixtable, mon_yrs[i].split('_')[0],
+                               midpoints[i], mon_yrs[i].split('_')[1])
+
+        # Write width table to Parquet store
+        if parquet:
+            write_width_store(widtable, width_out, utm_str)
+            continue
+
+        # Set output filepath
+        csv_fp = width_out + 'opera_' + utm_str + '_' + mon_yrs[i] + \
+            '_river_width.csv'
+
+        # Write width table to csv
+        widtable.to_csv(csv_fp, index=False)
@@ -18,8 +18,11 @@ import pandas as pd
 import numpy as np
 import glob
 import sys
-import re
 import os
+import tempfile
+from script_utils import get_opts, run_jobs
+from width_utils import file_window, store_windows, split_windows, \
+    group_windows, append_window, store_window
 
 
 # ******************************************************************************
@@ -27,18 +30,36 @@ import os
 # ******************************************************************************
 # 1 - width_in
 # 2 - width_out
+# Optional:
+# --parquet - read widths from a Parquet store in width_in, partitioned by
+#             start date and UTM zone, instead of csv files (default off)
+# --stream - group width files by window in a single pass and append the rows
+#            of each file to the file of its window, instead of combining all
+#            files of a window in memory (default off)
+# --workers N - number of worker processes splitting width files of all
+#               windows and combining windows in parallel with --stream or
+#               --parquet (default 1)
+# --max-mem MB - address space limit of each process running jobs
+#                (default none)
 
 
 # ******************************************************************************
 # Get command line arguments
 # ******************************************************************************
-IS_arg = len(sys.argv)
+args, opts = get_opts(sys.argv, {'parquet': False, 'stream': False,
+                                'workers': 1, 'max_mem': 0})
+
+IS_arg = len(args)
 if IS_arg != 3:
     print('ERROR - 2 arguments must be used')
     raise SystemExit(22)
 
-width_in = sys.argv[1]
-width_out = sys.argv[2]
+width_in = args[1]
+width_out = args[2]
+parquet = opts['parquet']
+stream = opts['stream']
+workers = opts['workers']
+max_mem = opts['max_mem']
 
 
 # ******************************************************************************
@@ -55,13 +76,48 @@ except IOError:
 # ******************************************************************************
 # Retrieve UTM zone width files
 # ******************************************************************************
-# Get list of file paths of width files
-width_files = sorted(list(glob.iglob(width_in + '*')))
-
-# Retrieve unique aggregation dates
-width_dates = [re.search(r'(\d{4}-\d{2}-\d{2}_\d{4}-\d{2}-\d{2})', x).group(1)
-               for x in width_files]
-mon_yrs = sorted(list(set(width_dates)))
+# Retrieve aggregation dates from the Parquet store
+if parquet:
+    windows = store_windows(width_in)
+    mon_yrs = (windows['startdate'] + '_' + windows['enddate']).tolist()
+
+# Group width files by aggregation date in a single pass
+elif stream:
+    width_files = sorted(list(glob.iglob(width_in + '*')))
+
+    # Split width files of all windows of a UTM zone, written by
+    # ThiessenWidthExtraction.py --batch, into files of each window in a
+    # temporary folder in width_out, each read once
+    split_tmp = tempfile.TemporaryDirectory(dir=width_out)
+    batch_files = [x for x in width_files if file_window(x) is None]
+    jobs = [(x, os.path.join(split_tmp.name, str(k) + '_'))
+            for k, x in enumerate(batch_files)]
+    split_files = dict(zip(batch_files, run_jobs(split_windows, jobs, workers,
+                                                 max_mem)))
+
+    window_files = group_windows(width_files, split_files)
+    mon_yrs = sorted(window_files)
+
+else:
+    # Get list of file paths of width files
+    width_files = sorted(list(glob.iglob(width_in + '*')))
+
+    # Retrieve aggregation dates of width files of single windows
+    width_dates = [file_window(x) for x in width_files]
+
+    # Read width files of all windows of a UTM zone, written by
+    # ThiessenWidthExtraction.py --batch, and retrieve the window of each row
+    batch_tables = {}
+    for x, date in zip(width_files, width_dates):
+        if date is None:
+            widtable = pd.read_csv(x)
+            batch_tables[x] = (widtable, widtable['startdate'] + '_' +
+                               widtable['enddate'])
+
+    # Retrieve unique aggregation dates
+    mon_yrs = sorted(list(set([x for x in width_dates if x is not None] +
+                              [x for _, w in batch_tables.values()
+                               for x in w.unique()])))
 
 
 # ******************************************************************************
@@ -69,21 +125,51 @@ mon_yrs = sorted(list(set(width_dates)))
 # ******************************************************************************
 print('Combining width files')
 
-for i in range(len(mon_yrs)):
+# Write each window from the Parquet store or by appending its files, with
+# windows run in parallel
+if parquet or stream:
+
+    jobs = []
+    for window_i in mon_yrs:
+        csv_fp = width_out + 'opera_' + window_i + '_river_width.csv'
+        if parquet:
+            jobs.append((width_in, window_i.split('_')[0], csv_fp))
+        else:
+            jobs.append((window_files[window_i], csv_fp))
+
+    func = store_window if parquet else append_window
+    for csv_fp in run_jobs(func, jobs, workers, max_mem):
+        print(os.path.basename(csv_fp))
+
+    # Remove files of each window split from width files of all windows
+    if stream:
+        split_tmp.cleanup()
+
+# Read and combine csv files of each window in memory
+else:
+
+    for i in range(len(mon_yrs)):
+
+        print(i)
 
-    print(i)
+        # Retrieve window
+        window_i = mon_yrs[i]
 
-    # Retrieve window
-    window_i = mon_yrs[i]
+        # Retrieve files with window_i date
+        files_i = np.array(width_files)[np.array(width_dates) ==
+                                        window_i].tolist()
 
-    # Retrieve files with window_i date
-    files_i = np.array(width_files)[np.array(width_dates) == window_i].tolist()
+        # Read csv files, along with rows of window_i in files of all windows
+        widtables = [pd.read_csv(x) if x in files_i else
+                     batch_tables[x][0][batch_tables[x][1] == window_i]
+                     for x in width_files
+                     if x in files_i or x in batch_tables]
 
-    # Read csv files and combine into one file
-    width_all = pd.concat([pd.read_csv(x) for x in files_i], ignore_index=True)
+        # Combine tables into one file
+        width_all = pd.concat(widtables, ignore_index=True)
 
-    # Set output filepath
-    csv_fp = width_out + 'opera_' + mon_yrs[i] + '_river_width.csv'
+        # Set output filepath
+        csv_fp = width_out + 'opera_' + mon_yrs[i] + '_river_width.csv'
 
-    # Write width table to csv
-    width_all.to_csv(csv_fp, index=False)
+        # Write width table to csv
+        width_all.to_csv(csv_fp, index=False)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# WindowPipeline.py
+# ******************************************************************************
+
+# Purpose:
+# This script runs the spatial aggregation, clumping, main river and pixel
+# class summary steps for each date window of a UTM zone in memory, writing
+# intermediate rasters and shapefiles only on request.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import os
+import glob
+import pandas as pd
+import geopandas as gpd
+import sys
+import re
+from composite_utils import priority_lut
+from merge_utils import window_tiles
+from pipeline_utils import process_window
+from river_utils import node_arrays
+from script_utils import get_opts, run_jobs
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - opera_in
+# 2 - tile_in
+# 3 - utm_str
+# 4 - voronoi_in
+# 5 - nodes_in
+# 6 - csv_out
+# Optional:
+# --merge-out DIR - output folder of merged rasters (default not written)
+# --clump-out DIR - output folder of reclassified rasters and clumped
+#                   polygons (default not written)
+# --conwater-out DIR - output folder of connected water, reclassified and main
+#                      river rasters (default not written)
+# --max-dist M - search distance (m) for the clump nearest to a node
+#                (default none)
+# --workers N - number of worker processes (default 1)
+# --max-mem MB - address space limit of each process running jobs
+#                (default none)
+
+
+# ******************************************************************************
+# Get command line arguments
+# ******************************************************************************
+args, opts = get_opts(sys.argv, {'merge_out': None, 'clump_out': None,
+                                'conwater_out': None, 'max_dist': 0.0,
+                                'workers': 1, 'max_mem': 0})
+
+IS_arg = len(args)
+if IS_arg != 7:
+    print('ERROR - 6 arguments must be used')
+    raise SystemExit(22)
+
+opera_in = args[1]
+tile_in = args[2]
+utm_str = args[3]
+voronoi_in = args[4]
+nodes_in = args[5]
+csv_out = args[6]
+max_dist = opts['max_dist']
+workers = opts['workers']
+max_mem = opts['max_mem']
+
+# Set output folders of intermediate files
+out_dirs = {}
+for stage in ['merge', 'clump', 'conwater']:
+    if opts[stage + '_out'] is not None:
+        out_dirs[stage] = opts[stage + '_out']
+
+
+# ******************************************************************************
+# Check if inputs exist
+# ******************************************************************************
+try:
+    if os.path.isdir(opera_in):
+        pass
+except IOError:
+    print('ERROR - '+opera_in+' invalid folder path')
+    raise SystemExit(22)
+
+try:
+    with open(tile_in) as file:
+        pass
+except IOError:
+    print('ERROR - Unable to open ' + tile_in)
+    raise SystemExit(22)
+
+try:
+    with open(voronoi_in) as file:
+        pass
+except IOError:
+    print('ERROR - Unable to open ' + voronoi_in)
+    raise SystemExit(22)
+
+try:
+    with open(nodes_in) as file:
+        pass
+except IOError:
+    print('ERROR - Unable to open ' + nodes_in)
+    raise SystemExit(22)
+
+
+# ******************************************************************************
+# Set merge options
+# ******************************************************************************
+# Set inundation extent option
+# 1 = maximum inundation extent
+# 2 = minimum inundation extent
+extent = 1
+
+# If maximum inundation option, prefer water and partial water
+if extent == 1:
+    priority = [1, 2, 252, 0, 253, 255]
+# If minimum inundation option, prefer land
+elif extent == 2:
+    priority = [0, 2, 1, 252, 253, 255]
+
+# Create a priority ranking: lower values in the list have higher priority
+priority_rank = priority_lut(priority)
+
+
+# ******************************************************************************
+# Read files
+# ******************************************************************************
+# Load csv of overlap between UTM Zones and OPERA
+tile_df = pd.read_csv(tile_in)
+
+# Retrieve tiles overlapping with UTM zone of interest
+tile_int = tile_df.loc[:, 'utm' + utm_str].dropna()
+
+# Retrieve all temporally aggregated OPERA files
+opera_files = sorted(glob.glob(opera_in + '*.tif'))
+
+# Filter files to those intersecting UTM zone
+fil_files = [f for f in opera_files if any(k in f for k in tile_int)]
+
+# Open Thiessen polygon file and calculate area of polygons in SqKM
+thiessen_pols = gpd.read_file(voronoi_in)
+thiessen_pols["Area_Sqkm"] = thiessen_pols['geometry'].area / 10**6
+
+# Load SWORD target nodes and retrieve their coordinates
+node_xy, _ = node_arrays(gpd.read_file(nodes_in))
+
+
+# ******************************************************************************
+# Read date windows from temporally aggregated OPERA tiles
+# ******************************************************************************
+# Get dates from OPERA files
+opera_dates = [re.search(r'(\d{4}-\d{2}-\d{2}_\d{4}-\d{2}-\d{2})', x).group(0)
+               for x in opera_files]
+
+fil_dates = [re.search(r'(\d{4}-\d{2}-\d{2}_\d{4}-\d{2}-\d{2})', x).group(0)
+             for x in fil_files]
+
+# Get unique date windows
+date_windows = sorted(list(set(opera_dates)))
+
+
+# ******************************************************************************
+# Run pipeline for each date window
+# ******************************************************************************
+# Retrieve tiles of each date window and the grid they are merged to, with
+# index maps of reprojected tiles held in a temporary folder in csv_out
+grid_tmp, windows = window_tiles(fil_files, fil_dates, date_windows, utm_str,
+                                 csv_out, workers)
+
+# Initialize list of date window jobs
+jobs = []
+
+for window_i, (sub_files, src_crs, src_res) in zip(date_windows, windows):
+    jobs.append((sub_files, src_crs, src_res, grid_tmp.name, priority_rank,
+                 utm_str, window_i, thiessen_pols, node_xy, csv_out, out_dirs,
+                 max_dist))
+
+# Run merge, clump, main river and pixel count steps for each date window
+for window_i, csv_fp in zip(date_windows,
+                            run_jobs(process_window, jobs, workers, max_mem)):
+    if csv_fp is None:
+        print(window_i + ' no water pixels')
+    else:
+        print(os.path.basename(csv_fp))
+
+# Remove index maps of the UTM zone
+grid_tmp.cleanup()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# composite_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains the compositing engine used to temporally aggregate
+# OPERA DSWx tiles based on a value priority list.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import os
+import json
+import numpy as np
+import rasterio
+from contextlib import ExitStack
+from script_utils import atomic_path
+
+
+# ******************************************************************************
+# Define priority lookup functions
+# ******************************************************************************
+# Create lookup table mapping OPERA values to their priority rank
+# Values missing from the priority list are assigned rank 0, as in the original
+# remapping that started from an array of zeros
+def priority_lut(priority):
+
+    lut = np.zeros(256, dtype=np.uint8)
+    for p in range(len(priority)):
+        lut[priority[p]] = p
+
+    return lut
+
+
+# Create array mapping priority ranks back to OPERA values
+def priority_values(priority):
+
+    return np.array(priority, dtype=np.uint8)
+
+
+# ******************************************************************************
+# Define compositing functions
+# ******************************************************************************
+# Fold OPERA values into a running composite of priority ranks in place,
+# keeping the lowest (most preferred) rank at each pixel
+def fold_ranks(comp, data, lut, buf):
+
+    # Map OPERA values to ranks without allocating a new array
+    np.take(lut, data, out=buf)
+
+    # Keep the preferred rank at each pixel
+    np.minimum(comp, buf, out=comp)
+
+
+# Count pixels of a composite that later files could still improve
+# Pixels at rank 0 already hold the most preferred value and are settled
+def improvable(comp):
+
+    return np.count_nonzero(comp)
+
+
+# Composite OPERA files into an array of priority ranks, skipping the remaining
+# files once every pixel is settled
+def composite_ranks(sub_files, lut):
+
+    for j in range(len(sub_files)):
+
+        with rasterio.open(sub_files[j]) as src:
+
+            # If first file, extract metadata and initialize arrays
+            if j == 0:
+                info = src.profile
+                data = src.read(1)
+                comp = np.take(lut, data)
+                buf = np.empty_like(comp)
+
+            # If not the first file, read into existing array and fold
+            else:
+                src.read(1, out=data)
+                fold_ranks(comp, data, lut, buf)
+
+        # Stop once no pixel can be improved by the remaining files
+        if improvable(comp) == 0:
+            break
+
+    return comp, info
+
+
+# Composite one block window of open OPERA datasets into priority ranks,
+# skipping the remaining datasets once every pixel of the block is settled
+def composite_block(srcs, window, lut):
+
+    for j in range(len(srcs)):
+
+        # If first dataset, initialize arrays for the block
+        if j == 0:
+            data = srcs[j].read(1, window=window)
+            comp = np.take(lut, data)
+            buf = np.empty_like(comp)
+
+        # If not the first dataset, read into existing array and fold
+        else:
+            srcs[j].read(1, window=window, out=data)
+            fold_ranks(comp, data, lut, buf)
+
+        # Stop once no pixel of the block can be improved
+        if improvable(comp) == 0:
+            break
+
+    return comp
+
+
+# ******************************************************************************
+# Define window compositing functions
+# ******************************************************************************
+# Open composite tif for writing using metadata of the first OPERA file
+def open_composite(out_fp, info):
+
+    return rasterio.open(out_fp, 'w', driver='GTiff', dtype=info['dtype'],
+                         nodata=info['nodata'], height=info['height'],
+                         width=info['width'], count=1, crs=info['crs'],
+                         transform=info['transform'],
+                         blockxsize=info['blockxsize'],
+                         blockysize=info['blockysize'],
+                         tiled=info['tiled'], compress=info['compress'],
+                         interleave=info['interleave'])
+
+
+# Composite OPERA files for one tile and date window and write to file
+# If blocks is True, the files are streamed through their internal blocks so
+# that only one block of each file is held in memory at a time
+# If resume is True, the manifest of an existing composite is checked: the
+# window is skipped if its files are unchanged, and only new files are folded
+# into the existing composite if the window has only gained files
+# Manifests are only written if resume is True, so that the output folder
+# holds no other files otherwise
+def composite_window(sub_files, out_fp, priority, blocks=False, resume=False):
+
+    # Describe input files for the composite manifest
+    records = file_records(sub_files)
+
+    # Set files to composite and status of the composite
+    in_files = sub_files
+    status = 'created'
+
+    if resume:
+        old_records = read_manifest(out_fp, priority)
+        if old_records is not None:
+
+            # Retrieve files that are new to the window
+            new_records = [r for r in records if r not in old_records]
+            new_files = [f for f, r in zip(sub_files, records)
+                         if r in new_records]
+
+            # Check that all files of the existing composite are unchanged
+            if len(records) - len(new_records) == len(old_records):
+
+                # Skip window if no files were added
+                if len(new_files) == 0:
+                    return out_fp, 'unchanged'
+
+                # Otherwise fold new files into the existing composite, whose
+                # values map back to the same ranks as the original files
+                in_files = [out_fp] + new_files
+                status = 'updated'
+
+    # Remove manifest of the existing composite, so that an interrupted run
+    # never leaves a manifest describing a composite that was not written
+    man_fp = manifest_path(out_fp)
+    if os.path.isfile(man_fp):
+        os.remove(man_fp)
+
+    # Write composite, replacing the existing one once complete
+    with atomic_path(out_fp) as write_fp:
+        if blocks:
+            composite_window_blocks(in_files, write_fp, priority)
+        else:
+            composite_window_full(in_files, write_fp, priority)
+
+    # Record input files of the composite for later runs
+    if resume:
+        write_manifest(out_fp, records, priority)
+
+    return out_fp, status
+
+
+# Composite whole OPERA files and write to file
+def composite_window_full(sub_files, out_fp, priority):
+
+    # Composite OPERA files as priority ranks
+    comp, info = composite_ranks(sub_files, priority_lut(priority))
+
+    # Map priority values back to original classes
+    data_out = priority_values(priority)[comp]
+
+    # # Remap ice to open water if option selected
+    # if icewater == 1:
+    #     data_out[data_out == 252] = 1
+
+    # Write composite tif to file
+    with open_composite(out_fp, info) as dst:
+        dst.write(data_out, 1)
+
+
+# Composite OPERA files block by block and write each block as it completes
+def composite_window_blocks(sub_files, out_fp, priority):
+
+    lut = priority_lut(priority)
+    rank_vals = priority_values(priority)
+
+    with ExitStack() as stack:
+
+        # Open all OPERA files of the window, sharing the same tile grid
+        srcs = [stack.enter_context(rasterio.open(f)) for f in sub_files]
+        info = srcs[0].profile
+
+        # Walk the native internal blocks of the first file
+        with open_composite(out_fp, info) as dst:
+            for _, window in srcs[0].block_windows(1):
+
+                # Composite block across files
+                comp = composite_block(srcs, window, lut)
+
+                # Map priority values back to original classes and write
+                dst.write(rank_vals[comp], 1, window=window)
+
+
+# ******************************************************************************
+# Define composite manifest functions
+# ******************************************************************************
+# Set manifest file path of a composite tif
+def manifest_path(out_fp):
+
+    return os.path.splitext(out_fp)[0] + '_manifest.json'
+
+
+# Describe OPERA files by name, size, and modification time
+def file_records(sub_files):
+
+    records = []
+    for f in sub_files:
+        stat = os.stat(f)
+        records.append({'name': os.path.basename(f),
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime_ns})
+
+    return records
+
+
+# Read input file records of an existing composite, returning None if the
+# composite or manifest is missing or was made with another priority list
+def read_manifest(out_fp, priority):
+
+    man_fp = manifest_path(out_fp)
+    if not (os.path.isfile(out_fp) and os.path.isfile(man_fp)):
+        return None
+
+    try:
+        with open(man_fp) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('priority') != list(priority):
+        return None
+
+    return manifest.get('files')
+
+
+# Write input file records of a composite to its manifest
+def write_manifest(out_fp, records, priority):
+
+    manifest = {'priority': list(priority), 'files': records}
+
+    with atomic_path(manifest_path(out_fp)) as man_fp:
+        with open(man_fp, 'w') as f:
+            json.dump(manifest, f, indent=1)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# label_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains functions used to clump regions of equal pixel values
+# in reclassified OPERA DSWx rasters into uniquely labeled regions.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.features import shapes
+from rasterio.windows import Window
+from pandas import DataFrame
+from geopandas import GeoDataFrame
+from shapely.geometry import shape
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from script_utils import run_jobs
+
+
+# ******************************************************************************
+# Declaration of constants
+# ******************************************************************************
+# Neighborhood of 8-connected (diagonal) clumping
+DIAG = np.ones((3, 3), dtype=bool)
+
+
+# ******************************************************************************
+# Define clumping functions
+# ******************************************************************************
+# Label regions of each non-zero value with 8-connectivity, offsetting the
+# labels of each value after the labels of previous values
+# Returns the labels, the number of labels, and the value of each label
+def label_values(data):
+
+    labels = np.zeros(data.shape, dtype=np.int32)
+    label_vals = [np.zeros(1, dtype=data.dtype)]
+    n = 0
+
+    for val in np.unique(data):
+        if val == 0:
+            continue
+
+        val_labels, val_n = ndimage.label(data == val, structure=DIAG,
+                                          output=np.int32)
+        val_mask = val_labels > 0
+        labels[val_mask] = val_labels[val_mask] + n
+        label_vals.append(np.full(val_n, val, dtype=data.dtype))
+        n += val_n
+
+    return labels, n, np.concatenate(label_vals)
+
+
+# Retrieve flat position of the first pixel of each label, in scan order
+def first_pixels(labels, n):
+
+    flat = labels.ravel()
+    pos = np.flatnonzero(flat)
+    first = np.full(n + 1, flat.size, dtype=np.int64)
+    np.minimum.at(first, flat[pos], pos)
+
+    return first
+
+
+# Create array mapping labels to their rank, given the flat position of their
+# first pixel, with background label 0 kept as 0
+def rank_labels(first):
+
+    remap = np.zeros(len(first), dtype=np.int32)
+    remap[1 + np.argsort(first[1:], kind='stable')] = \
+        np.arange(1, len(first), dtype=np.int32)
+
+    return remap
+
+
+# Renumber labels 1 to n in the order in which they are first met when
+# scanning the raster row by row
+def scan_order(labels, n):
+
+    return rank_labels(first_pixels(labels, n))[labels]
+
+
+# Clump regions of equal values with 8-connectivity, keeping zero values as
+# background, as done by the WhiteboxTools clump tool with diag=True and
+# zero_back=True
+# Regions are labeled from 1 in the order of their first pixel in the raster
+def clump_labels(data):
+
+    labels, n, _ = label_values(data)
+
+    return scan_order(labels, n)
+
+
+# ******************************************************************************
+# Define tiled clumping functions
+# ******************************************************************************
+# Label regions of one window of a raster file independently of the rest of
+# the raster
+# Returns the labels, the number of labels, the value of each label, and the
+# flat position of the first pixel of each label in the whole raster
+def label_window(fp, window):
+
+    with rasterio.open(fp) as src:
+        data = src.read(1, window=window)
+        width = src.width
+
+    labels, n, label_vals = label_values(data)
+
+    # Convert first pixel positions from the window to the whole raster
+    rows, cols = np.divmod(first_pixels(labels, n), data.shape[1])
+    first = (rows + window.row_off) * width + cols + window.col_off
+
+    return labels, n, label_vals, first
+
+
+# Retrieve pairs of labels of equal values touching across a seam between two
+# adjacent lines of pixels, including diagonal neighbors
+def seam_pairs(line_a, line_b, label_vals):
+
+    a = np.concatenate([line_a, line_a[:-1], line_a[1:]])
+    b = np.concatenate([line_b, line_b[1:], line_b[:-1]])
+
+    touch = (a > 0) & (b > 0)
+    a, b = a[touch], b[touch]
+    same = label_vals[a] == label_vals[b]
+
+    return a[same], b[same]
+
+
+# Clump regions of equal values of a raster file, as done by clump_labels, by
+# labeling square blocks of block_size pixels independently (in parallel if
+# workers > 1) and merging labels touching across block seams
+# Labels are written to a memory-mapped temporary file in the folder of the
+# raster, and only one block of the raster and the lines of pixels along block
+# seams are held in memory at a time
+# Returns the labels as a memory-mapped array
+def clump_labels_tiled(fp, block_size, workers=1):
+
+    with rasterio.open(fp) as src:
+        height, width = src.height, src.width
+
+    # Set windows of blocks
+    windows = [Window(c, r, min(block_size, width - c),
+                      min(block_size, height - r))
+               for r in range(0, height, block_size)
+               for c in range(0, width, block_size)]
+
+    # Create memory-mapped temporary file of labels, removed once unused
+    with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(fp))) \
+            as tmp:
+        labels = np.memmap(tmp, dtype=np.int32, mode='w+',
+                           shape=(height, width))
+
+    # Label blocks, offsetting block labels after labels of previous blocks
+    label_vals = [np.zeros(1, dtype=np.uint8)]
+    first = [np.full(1, -1, dtype=np.int64)]
+    n = 0
+
+    # Lines of block labels along seams, by row or column of the seam
+    top, bottom, left, right = {}, {}, {}, {}
+
+    jobs = [(fp, window) for window in windows]
+    for window, (blk_labels, blk_n, blk_vals, blk_first) in \
+            zip(windows, run_jobs(label_window, jobs, workers)):
+
+        blk_labels[blk_labels > 0] += n
+        labels[window.toslices()] = blk_labels
+        label_vals.append(blk_vals[1:])
+        first.append(blk_first[1:])
+        n += blk_n
+
+        # Keep edge lines of block, in column (rows) or row (columns) order
+        r, c = window.row_off, window.col_off
+        top.setdefault(r, []).append(blk_labels[0])
+        bottom.setdefault(r + window.height, []).append(blk_labels[-1])
+        left.setdefault(c, []).append(blk_labels[:, 0])
+        right.setdefault(c + window.width, []).append(blk_labels[:, -1])
+
+    label_vals = np.concatenate(label_vals)
+    first = np.concatenate(first)
+
+    # Retrieve pairs of labels touching across horizontal and vertical seams
+    pairs = [seam_pairs(np.concatenate(bottom[r]), np.concatenate(top[r]),
+                        label_vals)
+             for r in range(block_size, height, block_size)]
+    pairs += [seam_pairs(np.concatenate(right[c]), np.concatenate(left[c]),
+                         label_vals)
+              for c in range(block_size, width, block_size)]
+    a = np.concatenate([np.zeros(0, dtype=np.int32)] + [p[0] for p in pairs])
+    b = np.concatenate([np.zeros(0, dtype=np.int32)] + [p[1] for p in pairs])
+
+    # Resolve table of equivalent labels into merged regions
+    table = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)),
+                       shape=(n + 1, n + 1))
+    _, region = connected_components(table, directed=False)
+
+    # Rank merged regions by their first pixel, with the background first
+    region_first = np.full(region.max() + 1, height * width, dtype=np.int64)
+    np.minimum.at(region_first, region, first)
+    remap = np.argsort(np.argsort(region_first, kind='stable')).astype(
+        np.int32)[region]
+
+    # Renumber labels block by block
+    for window in windows:
+        labels[window.toslices()] = remap[labels[window.toslices()]]
+    labels.flush()
+
+    return labels
+
+
+# ******************************************************************************
+# Define clump polygon functions
+# ******************************************************************************
+# Convert clumps of a (masked) label array into polygons with their label as
+# class, leaving out the background
+def clump_polygons(data, transform, crs):
+
+    shape_gen = ((shape(s), v) for s, v in shapes(data, transform=transform))
+    df = DataFrame(shape_gen, columns=['geometry', 'class'])
+    df = df.loc[df['class'] != 0]
+
+    return GeoDataFrame(df['class'], geometry=df.geometry, crs=crs)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# merge_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains functions used to reproject and realign temporally
+# aggregated OPERA tiles before they are spatially merged.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import hashlib
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import array_bounds
+from rasterio.windows import Window
+from affine import Affine
+from contextlib import ExitStack
+from functools import partial
+from rasterio.merge import merge
+from rasterio.warp import calculate_default_transform, reproject, Resampling
+from script_utils import atomic_path
+
+
+# ******************************************************************************
+# Declaration of constants
+# ******************************************************************************
+# Index map value of destination pixels not covered by the source tile
+NO_INDEX = np.iinfo(np.uint32).max
+
+
+# ******************************************************************************
+# Define reprojection grid functions
+# ******************************************************************************
+# Build key identifying the source grid of a tile and its target CRS/resolution
+def grid_key(reproj, dst_crs, res):
+
+    return (reproj.crs.to_string(), tuple(reproj.transform), reproj.width,
+            reproj.height, dst_crs.to_string(), tuple(res))
+
+
+# Check if the pixels of a tile coincide with pixels of an aligned grid in
+# dst_crs, so that its nearest neighbor reprojection is the identity
+def on_grid(reproj, dst_crs, transform, width, height):
+
+    if reproj.crs != dst_crs:
+        return False
+
+    # Compare pixel sizes and rotation terms
+    src_t = reproj.transform
+    if (src_t.a, src_t.b, src_t.d, src_t.e) != \
+            (transform.a, transform.b, transform.d, transform.e):
+        return False
+
+    # Retrieve pixel offsets of tile within the aligned grid
+    col_off = (src_t.c - transform.c) / transform.a
+    row_off = (src_t.f - transform.f) / transform.e
+    if col_off != round(col_off) or row_off != round(row_off):
+        return False
+
+    return (0 <= col_off and col_off + reproj.width <= width and
+            0 <= row_off and row_off + reproj.height <= height)
+
+
+# Retrieve file path of the index map of a tile in grid_dir, given its key
+def grid_index_fp(grid_dir, key):
+
+    h = hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+
+    return os.path.join(grid_dir, 'grid_' + h + '.npy')
+
+
+# Retrieve the aligned destination grid of an open tile reprojected to
+# dst_crs, and the source pixel feeding each destination pixel
+# The index map of the source pixels is computed once per tile and kept in
+# grid_dir as a .npy file, read back memory-mapped so that only the rows in use
+# are loaded; date windows and worker processes sharing grid_dir reproject by
+# indexing instead of warping
+def get_grid(reproj, dst_crs, res, grid_dir):
+
+    # Calculate the transform and dimensions to project to new CRS
+    target_transform, target_width, target_height = \
+        calculate_default_transform(reproj.crs, dst_crs,
+                                    reproj.width, reproj.height,
+                                    *reproj.bounds)
+
+    # Align pixel grids to source raster with target CRS
+    align_transform, align_width, align_height = \
+        rasterio.warp.aligned_target(transform=target_transform,
+                                     width=target_width,
+                                     height=target_height,
+                                     resolution=res)
+
+    # Retrieve bounds of aligned grid
+    bounds = array_bounds(align_height, align_width, align_transform)
+
+    # If tile pixels already lie on the aligned grid in the target CRS, the
+    # tile is used directly without reprojection
+    if on_grid(reproj, dst_crs, align_transform, align_width, align_height):
+        return {'native': True, 'bounds': bounds}
+
+    index_fp = grid_index_fp(grid_dir, grid_key(reproj, dst_crs, res))
+
+    if not os.path.isfile(index_fp):
+
+        # Warp flat source pixel indices with the same nearest neighbor warp
+        # used for the data, so that indexing reproduces GDAL exactly
+        src_index = np.arange(reproj.width * reproj.height, dtype=np.uint32)
+        dst_index = np.full((align_height, align_width), NO_INDEX,
+                            dtype=np.uint32)
+        reproject(
+            source=src_index.reshape(reproj.height, reproj.width),
+            destination=dst_index,
+            src_transform=reproj.transform,
+            src_crs=reproj.crs,
+            dst_transform=align_transform,
+            dst_crs=dst_crs,
+            dst_nodata=NO_INDEX,
+            resampling=Resampling.nearest
+        )
+
+        # Write index map, shared by the processes using grid_dir
+        with atomic_path(index_fp) as tmp_fp, open(tmp_fp, 'wb') as f:
+            np.save(f, dst_index)
+
+    return {'native': False,
+            'bounds': bounds,
+            'transform': align_transform,
+            'width': align_width,
+            'height': align_height,
+            'index': np.load(index_fp, mmap_mode='r')}
+
+
+# Compute the index maps of tiles in grid_dir ahead of their use
+def prepare_grids(sub_files, dst_crs, res, grid_dir):
+
+    for reproj_in in sub_files:
+        with rasterio.open(reproj_in) as reproj:
+            get_grid(reproj, dst_crs, res, grid_dir)
+
+
+# ******************************************************************************
+# Define date window functions
+# ******************************************************************************
+# Retrieve the tiles of each date window of a UTM zone (files in fil_files with
+# dates fil_dates), with the CRS and resolution of the tile of the window in
+# the UTM zone (source raster), onto which all tiles of the window are merged
+# A temporary folder is created in tmp_dir to hold the index maps of
+# reprojected tiles, and with several workers the index maps are computed
+# before forking workers, so that they are computed once per tile and shared
+# by all workers
+# Returns the temporary folder, to be removed once all windows are merged, and
+# a list of (tiles, CRS, resolution) for each date window
+def window_tiles(fil_files, fil_dates, date_windows, utm_str, tmp_dir,
+                 workers=1):
+
+    grid_tmp = tempfile.TemporaryDirectory(dir=tmp_dir)
+
+    windows = []
+    for window_i in date_windows:
+
+        # Retrieve file paths corresponding to window_i
+        sub_files = [fil_files[i] for i, window in enumerate(fil_dates)
+                     if window == window_i]
+
+        # Set filepath corresponding to source raster with target CRS
+        src_in = next((file for file in sub_files
+                       if ('T' + utm_str[0:2]) in file), None)
+
+        # Read source raster (unchanging layer)
+        with rasterio.open(src_in) as src:
+            # Get source CRS and resolution
+            src_crs = src.crs
+            src_res = (src.transform[0], -src.transform[4])
+
+        if workers > 1:
+            prepare_grids(sub_files, src_crs, src_res, grid_tmp.name)
+
+        windows.append((sub_files, src_crs, src_res))
+
+    return grid_tmp, windows
+
+
+# Gather source pixels of a tile into (part of) its destination grid, given
+# the corresponding part of the index map
+# Only the window of source pixels feeding the destination pixels is read
+def gather_tile(reproj, index):
+
+    nodata = 0 if reproj.nodata is None else reproj.nodata
+    out = np.full(index.shape, nodata, dtype=reproj.dtypes[0])
+
+    # Retrieve destination pixels covered by the source tile
+    valid = index != NO_INDEX
+    if not valid.any():
+        return out
+
+    # Retrieve source rows and columns feeding destination pixels
+    rows, cols = np.divmod(index[valid], np.uint32(reproj.width))
+    row0, col0 = rows.min(), cols.min()
+
+    # Read bounding window of source pixels and copy them by index
+    data = reproj.read(1, window=Window(int(col0), int(row0),
+                                        int(cols.max() - col0 + 1),
+                                        int(rows.max() - row0 + 1)))
+    out[valid] = data[rows - row0, cols - col0]
+
+    return out
+
+
+# ******************************************************************************
+# Define tile reprojection functions
+# ******************************************************************************
+# Reproject a tile to dst_crs on a grid aligned to resolution res, returning
+# an open dataset and the bounds of the aligned grid
+# The dataset is the source file itself if its pixels already lie on the
+# aligned grid in dst_crs, or otherwise an in-memory copy of the reprojected
+# tile
+# Index maps of destination grids are kept in grid_dir, so that later date
+# windows over the same tile reproject by indexing instead of warping
+def reproject_tile(reproj_in, dst_crs, res, grid_dir):
+
+    reproj = rasterio.open(reproj_in)
+
+    # Retrieve or compute the destination grid of the tile
+    grid = get_grid(reproj, dst_crs, res, grid_dir)
+
+    # Open source dataset directly if it does not need reprojection
+    if grid['native']:
+        return reproj, grid['bounds']
+
+    with reproj:
+
+        # Update metadata for the output raster
+        reproj_args = reproj.meta.copy()
+        reproj_args.update({
+            'crs': dst_crs,
+            'transform': grid['transform'],
+            'width': grid['width'],
+            'height': grid['height']
+        })
+
+        # Copy source pixels into destination grid by index
+        out = gather_tile(reproj, grid['index'])
+
+    # Store the reprojected data in memory
+    with MemoryFile() as memfile:
+        with memfile.open(**reproj_args) as dst:
+            dst.write(out, 1)
+        return memfile.open(), grid['bounds']
+
+
+# Retrieve bounds covering all reprojected tiles
+def union_bounds(bounds):
+
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+
+# ******************************************************************************
+# Define priority merge functions
+# ******************************************************************************
+# Update old data in place where new data has a higher priority (lower rank)
+def fold_priority(old_data, new_data, priority_rank):
+
+    replace_mask = priority_rank[new_data] < priority_rank[old_data]
+    np.copyto(old_data, new_data, where=replace_mask)
+
+
+# Create custom merge function that merges rasters based on value priority,
+# to be passed to rasterio.merge with priority_rank bound by functools.partial
+def priority_merge(old_data, new_data, old_nodata=None, new_nodata=None,
+                   index=None, roff=None, coff=None, priority_rank=None):
+
+    # Retrieve values of new data, including those under its nodata mask
+    new_data = np.ma.getdata(new_data)
+
+    # Update old_data in place where the new_data has higher priority
+    fold_priority(old_data, new_data, priority_rank)
+
+
+# Merge tiles in memory after reprojecting each of them in memory, returning
+# the merged array and its metadata
+def merge_tiles_array(sub_files, dst_crs, res, grid_dir, priority_rank):
+
+    # Reproject each raster and store it in MemoryFile, opening rasters already
+    # aligned to the target grid directly
+    reproj_rasters, reproj_bounds = zip(*[
+        reproject_tile(reproj_in, dst_crs, res, grid_dir)
+        for reproj_in in sub_files])
+
+    # Merge OPERA tiles with custom priority merge, over the extent of the
+    # aligned grids of all rasters
+    merge_rast, out_trans = merge(list(reproj_rasters),
+                                  bounds=union_bounds(reproj_bounds),
+                                  method=partial(priority_merge,
+                                                 priority_rank=priority_rank))
+
+    # Remove extra dimension if it exists
+    merge_rast = np.squeeze(merge_rast)
+
+    # Get the metadata from the first raster
+    meta = reproj_rasters[0].meta.copy()
+
+    # Close source and in-memory rasters
+    for r in reproj_rasters:
+        r.close()
+
+    # Update metadata for merged raster
+    meta.update({
+        'height': merge_rast.shape[0],
+        'width': merge_rast.shape[1],
+        'transform': out_trans,
+        'compress': 'LZW'
+    })
+
+    return merge_rast, meta
+
+
+# Merge tiles into merge_fp after reprojecting each of them in memory
+def merge_tiles(sub_files, dst_crs, res, grid_dir, priority_rank, merge_fp):
+
+    merge_rast, meta = merge_tiles_array(sub_files, dst_crs, res, grid_dir,
+                                         priority_rank)
+
+    # Write the merged raster to a file
+    with rasterio.open(merge_fp, 'w', **meta) as dst:
+        dst.write(merge_rast, 1)
+
+    return merge_fp
+
+
+# Merge the tiles of one date window into merge_fp, either in memory or
+# lazily by chunks of chunk_size output rows
+def merge_window(sub_files, dst_crs, res, grid_dir, priority_rank, merge_fp,
+                 lazy=False, chunk_size=1024):
+
+    if lazy:
+        return merge_tiles_lazy(sub_files, dst_crs, res, grid_dir,
+                                priority_rank, merge_fp, chunk_size)
+
+    return merge_tiles(sub_files, dst_crs, res, grid_dir, priority_rank,
+                       merge_fp)
+
+
+# ******************************************************************************
+# Define lazy mosaicking functions
+# ******************************************************************************
+# Merge tiles into merge_fp by chunks of output rows, with the same result as
+# reprojecting each tile in full and merging them with a priority merge
+# Tiles are only opened, and for each chunk only the rows of the memory-mapped
+# index maps and the source pixels feeding the chunk are read, so that memory
+# use grows with the chunk size rather than the number of tiles (apart from
+# warping the index map of a tile the first time it is used)
+def merge_tiles_lazy(sub_files, dst_crs, res, grid_dir, priority_rank,
+                     merge_fp, chunk_size):
+
+    with ExitStack() as stack:
+
+        # Open tiles and retrieve their destination grids
+        tiles = []
+        for reproj_in in sub_files:
+            reproj = stack.enter_context(rasterio.open(reproj_in))
+            tiles.append((reproj, get_grid(reproj, dst_crs, res, grid_dir)))
+
+        # Set output grid covering the aligned grids of all tiles, as computed
+        # by rasterio.merge
+        dst_w, dst_s, dst_e, dst_n = union_bounds([g['bounds']
+                                                   for _, g in tiles])
+        out_width = int(round((dst_e - dst_w) / res[0]))
+        out_height = int(round((dst_n - dst_s) / res[1]))
+        out_trans = Affine.translation(dst_w, dst_n) * \
+            Affine.scale(res[0], -res[1])
+
+        # Retrieve pixel extent of each tile in the output grid
+        extents = []
+        for reproj, grid in tiles:
+            if grid['native']:
+                t, w, h = reproj.transform, reproj.width, reproj.height
+            else:
+                t, w, h = grid['transform'], grid['width'], grid['height']
+            row_off = int(round((t.f - out_trans.f) / out_trans.e))
+            col_off = int(round((t.c - out_trans.c) / out_trans.a))
+            extents.append((row_off, col_off, h, w))
+
+        # Set metadata of merged raster from the first tile
+        meta = tiles[0][0].meta.copy()
+        meta.update({
+            'crs': dst_crs,
+            'height': out_height,
+            'width': out_width,
+            'transform': out_trans,
+            'compress': 'LZW'
+        })
+        nodata = 0 if meta['nodata'] is None else meta['nodata']
+
+        with rasterio.open(merge_fp, 'w', **meta) as dst:
+            for j in range(0, out_height, chunk_size):
+
+                # Initialize chunk of output rows with nodata
+                chunk_height = min(chunk_size, out_height - j)
+                chunk = np.full((chunk_height, out_width), nodata,
+                                dtype=meta['dtype'])
+
+                # Fold overlapping part of each tile into the chunk
+                for (reproj, grid), (row_off, col_off, h, w) in \
+                        zip(tiles, extents):
+
+                    r0 = max(j, row_off)
+                    r1 = min(j + chunk_height, row_off + h)
+                    if r0 >= r1:
+                        continue
+
+                    # Read or gather tile rows overlapping the chunk
+                    if grid['native']:
+                        data = reproj.read(1, window=Window(
+                            0, r0 - row_off, w, r1 - r0))
+                    else:
+                        data = gather_tile(
+                            reproj, grid['index'][r0 - row_off:r1 - row_off])
+
+                    fold_priority(chunk[r0 - j:r1 - j, col_off:col_off + w],
+                                  data, priority_rank)
+
+                # Write chunk to the merged raster
+                dst.write(chunk, 1, window=Window(0, j, out_width,
+                                                  chunk_height))
+
+    return merge_fp
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# pipeline_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains the fused per-window pipeline that merges temporally
+# aggregated OPERA DSWx tiles, clumps them, identifies the main river, and
+# counts main river pixels of each class for each SWORD node in memory.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import numpy as np
+import rasterio
+from rasterio.features import geometry_mask
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
+from label_utils import clump_labels, clump_polygons
+from merge_utils import merge_tiles_array
+from pixel_utils import zonal_counts, pixel_class_table
+from reclass_utils import CLUMP_MAP, RIVER_MAP, WATER_VALS, reclass_lut
+from river_utils import node_pixels, select_labels, connected_water, \
+    mask_window
+
+
+# ******************************************************************************
+# Define raster writing functions
+# ******************************************************************************
+# Write a single band array to file with metadata updated for its grid
+def write_band(fp, data, meta, transform):
+
+    out_meta = meta.copy()
+    out_meta.update({'driver': 'GTiff',
+                     'height': data.shape[0],
+                     'width': data.shape[1],
+                     'transform': transform,
+                     'dtype': data.dtype,
+                     'compress': 'lzw'})
+
+    with rasterio.open(fp, 'w', **out_meta) as dst:
+        dst.write(data, 1)
+
+
+# ******************************************************************************
+# Define fused window pipeline
+# ******************************************************************************
+# Run the SpatialAgg_OPERA.py, Clump.py, CreatingMainRiver.py (raster mode) and
+# PixelClassSummary.py stages for one UTM zone and date window in memory, and
+# write the pixel counts of each node to csv_out
+# out_dirs maps the 'merge', 'clump' and 'conwater' stages to the output
+# folders of their scripts, and the files of a stage are only written if it is
+# given; the 'clump' and 'conwater' folders hold the same subfolders as those
+# written by Clump.py and CreatingMainRiver.py --debug
+# Returns the path of the pixel count file, or None if the merged raster has
+# no water pixels
+def process_window(sub_files, dst_crs, res, grid_dir, priority_rank, utm_str,
+                   window_i, thiessen_pols, node_xy, csv_out, out_dirs=None,
+                   max_dist=0):
+
+    if out_dirs is None:
+        out_dirs = {}
+    name = 'opera_' + utm_str + '_' + window_i
+
+    # **************************************************************************
+    # Merge tiles
+    # **************************************************************************
+    merge_data, meta = merge_tiles_array(sub_files, dst_crs, res, grid_dir,
+                                         priority_rank)
+    transform = meta['transform']
+
+    if 'merge' in out_dirs:
+        with rasterio.open(out_dirs['merge'] + name + '.tif', 'w',
+                           **meta) as dst:
+            dst.write(merge_data, 1)
+
+    # Skip windows without water pixels
+    if not np.isin(merge_data, WATER_VALS).any():
+        return None
+
+    # **************************************************************************
+    # Reclassify and clump pixels
+    # **************************************************************************
+    reclass_data = np.take(reclass_lut(CLUMP_MAP), merge_data)
+
+    # Clump regions of equal values and clip them to thiessen polygons
+    labels = clump_labels(reclass_data)
+    outside = geometry_mask(thiessen_pols.geometry, labels.shape, transform)
+    labels[outside] = 0
+
+    if 'clump' in out_dirs:
+        with rasterio.open(out_dirs['clump'] + 'reclass/' + name +
+                           '_reclassified.tif', 'w', **meta) as dst:
+            dst.write(reclass_data, 1)
+
+        # Convert clumps within thiessen polygons into polygons, or write no
+        # polygon over the whole raster if thiessen polygons do not overlap it
+        if (~outside).any():
+            clip_window = mask_window(~outside)
+        else:
+            clip_window = Window(0, 0, labels.shape[1], labels.shape[0])
+        slices = clip_window.toslices()
+        data = np.ma.masked_array(labels[slices], mask=outside[slices])
+        gdf = clump_polygons(data, window_transform(clip_window, transform),
+                             meta['crs'])
+        gdf.to_file(out_dirs['clump'] + 'clumpedras_poly/' + name +
+                    '_clumpedRas_poly.shp', driver='ESRI Shapefile')
+
+    # **************************************************************************
+    # Create the main river raster
+    # **************************************************************************
+    # Select clumps under or nearest to each node
+    rows, cols = node_pixels(node_xy, transform)
+    near_labels = select_labels(labels, rows, cols, max_dist / res[0])
+
+    # Retrieve reclassified values of selected clumps over their window, or 0
+    # over the whole raster if no clump is under or near a node
+    con_data, con_window = connected_water(reclass_data, labels, near_labels)
+    con_transform = window_transform(con_window, transform)
+
+    # Add connected water values to reclassified original values
+    river_data = np.take(reclass_lut(RIVER_MAP),
+                         merge_data[con_window.toslices()])
+    main_data = con_data + river_data
+
+    if 'conwater' in out_dirs:
+        write_band(out_dirs['conwater'] + 'con_ras/' + name +
+                   '_connected_water_raster.tif', con_data, meta,
+                   con_transform)
+        write_band(out_dirs['conwater'] + 'con_reclass/' + name +
+                   '_connected_reclass.tif',
+                   np.take(reclass_lut(RIVER_MAP), merge_data), meta,
+                   transform)
+        write_band(out_dirs['conwater'] + 'main_river/' + name +
+                   '_main_river.tif', main_data, meta, con_transform)
+
+    # **************************************************************************
+    # Count pixel classes in thiessen polygons
+    # **************************************************************************
+    pixel_numbers = zonal_counts(thiessen_pols['geometry'], main_data,
+                                 con_transform)
+    pixel_class = pixel_class_table(thiessen_pols, pixel_numbers)
+
+    csv_fp = csv_out + name + '_pixel_nums_thiessen.csv'
+    pixel_class.to_csv(csv_fp, index=False)
+
+    return csv_fp
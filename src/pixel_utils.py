@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# pixel_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains functions used to count the main river pixels of each
+# class corresponding to each SWORD node Thiessen polygon.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import hashlib
+import math
+import os
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.transform import Affine
+from script_utils import atomic_path
+
+
+# ******************************************************************************
+# Declaration of constants
+# ******************************************************************************
+# Names of main river pixel classes
+PIXEL_CLASSES = {0: 'Land',
+                 1: 'Unconnected_Open',
+                 2: 'Connected_Open',
+                 3: 'Unconnected_Partial',
+                 4: 'Connected_Partial',
+                 252: 'IceSnow',
+                 253: 'Clouds',
+                 255: 'No_Data'}
+
+# No Data value of main river rasters, left out of pixel counts
+NODATA = 255
+
+# Columns of pixel count files
+PIXEL_COLS = ['node_id', 'reach_id', 'node_len', 'x', 'y', 'Area_Sqkm',
+              'Unconnected_Open', 'Unconnected_Partial', 'Connected_Open',
+              'Connected_Partial', 'Land', 'Clouds', 'IceSnow', 'No_Data']
+
+
+# ******************************************************************************
+# Define zone raster functions
+# ******************************************************************************
+# Retrieve transform and shape of a grid aligned to a raster grid and covering
+# the bounds of polygons
+def zone_grid(geoms, transform):
+
+    w, s, e, n = geoms.total_bounds
+    col0 = math.floor((w - transform.c) / transform.a)
+    row0 = math.floor((n - transform.f) / transform.e)
+    col1 = math.ceil((e - transform.c) / transform.a)
+    row1 = math.ceil((s - transform.f) / transform.e)
+
+    return transform * Affine.translation(col0, row0), (row1 - row0,
+                                                        col1 - col0)
+
+
+# Check if a raster grid is aligned to a zone grid, with the same pixel size
+# and whole pixel offsets
+def grid_aligned(zone_transform, transform):
+
+    if (zone_transform.a, zone_transform.e) != (transform.a, transform.e):
+        return False
+
+    col = (transform.c - zone_transform.c) / transform.a
+    row = (transform.f - zone_transform.f) / transform.e
+
+    return abs(col - round(col)) < 1e-6 and abs(row - round(row)) < 1e-6
+
+
+# Burn the zone ids of polygons (position in geoms + 1) into a raster, with
+# pixels whose centers lie outside of all polygons set to 0
+def zone_raster(geoms, transform, shape):
+
+    zone_shapes = [(geom, k + 1) for k, geom in enumerate(geoms)
+                   if geom is not None and not geom.is_empty]
+    if len(zone_shapes) == 0:
+        return np.zeros(shape, dtype=np.int32)
+
+    return rasterize(zone_shapes, out_shape=shape, transform=transform,
+                     fill=0, dtype=np.int32)
+
+
+# ******************************************************************************
+# Define zone raster cache functions
+# ******************************************************************************
+# Retrieve SHA-256 hash of a file, read by chunks
+def file_hash(fp):
+
+    h = hashlib.sha256()
+    with open(fp, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+# Retrieve file path of the cached zone raster of a shapefile (given by the
+# hash of its file) on a zone grid
+def zone_cache_fp(cache_dir, shp_hash, transform, shape):
+
+    h = hashlib.sha256(shp_hash.encode())
+    h.update(repr((tuple(transform)[:6], tuple(shape))).encode())
+
+    return os.path.join(cache_dir, 'zones_' + h.hexdigest()[:16] + '.tif')
+
+
+# Retrieve file path of the zone raster of polygons on a zone grid from the
+# cache, burning it and writing it to the cache first if missing
+def cached_zone_raster(cache_dir, shp_hash, geoms, transform, shape, crs):
+
+    zone_fp = zone_cache_fp(cache_dir, shp_hash, transform, shape)
+
+    if not os.path.isfile(zone_fp):
+        zones = zone_raster(geoms, transform, shape)
+
+        with atomic_path(zone_fp) as tmp_fp:
+            with rasterio.open(tmp_fp, 'w', driver='GTiff',
+                               height=shape[0], width=shape[1], count=1,
+                               dtype=zones.dtype, crs=crs,
+                               transform=transform, tiled=True,
+                               blockxsize=512, blockysize=512,
+                               compress='lzw') as dst:
+                dst.write(zones, 1)
+
+    return zone_fp
+
+
+# ******************************************************************************
+# Define zone table functions
+# ******************************************************************************
+# Build table of the flat pixel indices of each of n_zones zones of a zone
+# raster, as CSR offsets (n_zones + 1 values) into an array of indices sorted
+# by zone, so the pixels of zone k are indices[offsets[k]:offsets[k + 1]]
+def zone_table(zones, n_zones):
+
+    flat = zones.ravel()
+    idx = np.flatnonzero(flat)
+    zone = flat[idx]
+
+    # Sort pixel indices by zone, keeping raster order within each zone
+    order = np.argsort(zone, kind='stable')
+    dtype = np.uint32 if flat.size < 2**32 else np.uint64
+    indices = idx[order].astype(dtype)
+
+    offsets = np.zeros(n_zones + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(zone, minlength=n_zones + 1)[1:])
+
+    return offsets, indices
+
+
+# Retrieve file paths of the offsets and indices of the zone table of a cached
+# zone raster, stored next to it as uncompressed .npy files
+def zone_table_fps(zone_fp):
+
+    base = os.path.splitext(zone_fp)[0]
+
+    return base + '_offsets.npy', base + '_indices.npy'
+
+
+# Retrieve the zone table of a cached zone raster, memory-mapping its offsets
+# and indices from the .npy files next to the zone raster, or building them and
+# writing them there first if missing
+# Returns the offsets and indices of the table, with the transform and shape
+# of the zone grid
+def cached_zone_table(zone_fp, n_zones):
+
+    table_fps = zone_table_fps(zone_fp)
+
+    with rasterio.open(zone_fp) as src:
+        if not all(os.path.isfile(x) for x in table_fps):
+            for table_fp, arr in zip(table_fps, zone_table(src.read(1),
+                                                           n_zones)):
+                with atomic_path(table_fp) as tmp_fp, open(tmp_fp, 'wb') as f:
+                    np.save(f, arr)
+
+        zone_transform, zone_shape = src.transform, src.shape
+
+    offsets, indices = (np.load(x, mmap_mode='r') for x in table_fps)
+
+    return offsets, indices, zone_transform, zone_shape
+
+
+# Gather pixel values of the zones of a zone table from a raster aligned to
+# the zone grid, for entries start to stop of the table indices, leaving out
+# zone pixels outside of the raster
+# Returns the zone (position in the table) and value of each gathered pixel
+def zone_values(offsets, indices, zone_transform, zone_shape, data,
+                transform, start=0, stop=None):
+
+    stop = len(indices) if stop is None else min(stop, len(indices))
+    col_off = int(round((transform.c - zone_transform.c) / transform.a))
+    row_off = int(round((transform.f - zone_transform.f) / transform.e))
+
+    # Convert flat indices of zone grid into rows and columns of raster
+    rows, cols = np.divmod(indices[start:stop].astype(np.int64),
+                           zone_shape[1])
+    rows -= row_off
+    cols -= col_off
+    inside = (rows >= 0) & (rows < data.shape[0]) & \
+        (cols >= 0) & (cols < data.shape[1])
+
+    zone = np.searchsorted(offsets, np.arange(start, stop), side='right') - 1
+
+    return zone[inside], data[rows[inside], cols[inside]]
+
+
+# ******************************************************************************
+# Define pixel count functions
+# ******************************************************************************
+# Count pixels of each value of a raster within each of n_zones zones of a
+# zone raster, leaving out No Data pixels and pixels outside of the zone grid
+# Returns an array of counts with one row per zone and one column per value
+def zone_counts(zones, zone_transform, data, transform, n_zones):
+
+    # Retrieve overlap of raster with zone grid
+    col_off = int(round((transform.c - zone_transform.c) / transform.a))
+    row_off = int(round((transform.f - zone_transform.f) / transform.e))
+    r0, r1 = max(row_off, 0), min(row_off + data.shape[0], zones.shape[0])
+    c0, c1 = max(col_off, 0), min(col_off + data.shape[1], zones.shape[1])
+    r1, c1 = max(r0, r1), max(c0, c1)
+
+    zone = zones[r0:r1, c0:c1].ravel().astype(np.int64)
+    val = data[r0 - row_off:r1 - row_off, c0 - col_off:c1 - col_off].ravel()
+
+    # Count zone and value pairs in a single pass
+    keep = (zone > 0) & (val != NODATA)
+    counts = np.bincount(zone[keep] * 256 + val[keep],
+                         minlength=(n_zones + 1) * 256)
+
+    return counts.reshape(n_zones + 1, 256)[1:]
+
+
+# Count pixels of each value of a raster within each zone of a zone table,
+# leaving out No Data pixels, as zone_counts does for a zone raster
+# Indices of the table are gathered by chunks of chunk_size entries, so that
+# only one chunk of a memory-mapped table is read at a time
+def table_counts(zone_tab, data, transform, chunk_size=2**22):
+
+    offsets, indices, zone_transform, zone_shape = zone_tab
+    n_zones = len(offsets) - 1
+
+    counts = np.zeros(n_zones * 256, dtype=np.int64)
+    for start in range(0, len(indices), chunk_size):
+        zone, val = zone_values(offsets, indices, zone_transform, zone_shape,
+                                data, transform, start, start + chunk_size)
+
+        keep = val != NODATA
+        counts += np.bincount(zone[keep] * 256 + val[keep],
+                              minlength=n_zones * 256)
+
+    return counts.reshape(n_zones, 256)
+
+
+# Convert counts of each zone into a table of pixel numbers, with a column for
+# each value found in any zone
+# As in the categorical zonal statistics previously used, columns of values
+# missing from a zone are floats, and other columns are integers
+def count_table(counts):
+
+    pixel_numbers = pd.DataFrame(index=range(counts.shape[0]))
+    for val in np.flatnonzero(counts.any(axis=0)):
+        col = counts[:, val]
+        if not col.all():
+            col = col.astype(np.float64)
+        pixel_numbers[int(val)] = col
+
+    return pixel_numbers
+
+
+# Count pixels of each value of a raster within each polygon, burning polygons
+# into a zone raster on the grid of the raster
+def zonal_counts(geoms, data, transform):
+
+    zones = zone_raster(geoms, transform, data.shape)
+
+    return count_table(zone_counts(zones, transform, data, transform,
+                                   len(geoms)))
+
+
+# Assemble Thiessen polygon attributes and pixel counts into the table of
+# pixel counts for each node
+def pixel_class_table(thiessen_pols, pixel_numbers):
+
+    # Assembly polygons and pixel numbers into dataframe
+    frames = [thiessen_pols, pixel_numbers]
+
+    # Label pixel classes
+    pixel_class = pd.concat(frames, axis=1)
+
+    # Add missing columns
+    for col in PIXEL_CLASSES:
+        if col not in pixel_class.columns:
+            pixel_class[col] = 0
+
+    pixel_class.rename(columns=PIXEL_CLASSES, inplace=True)
+
+    # Drop columns for output
+    pixel_class = pixel_class.filter(PIXEL_COLS)
+
+    # Round floats
+    pixel_class = pixel_class.round({'node_len': 4, 'x': 6, 'y': 6,
+                                     'Area_Sqkm': 6})
+
+    return pixel_class
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# reclass_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains functions used to reclassify pixel values of OPERA DSWx
+# rasters with lookup tables.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+
+# ******************************************************************************
+# Declaration of constants
+# ******************************************************************************
+# Reclassification of merged OPERA DSWx values before clumping
+CLUMP_MAP = {
+    0: 0,  # No data
+    1: 1,  # Open Water
+    2: 1,  # Partial Surface Water
+    252: 252,  # Snow/Ice
+    253: 0,  # Cloud/Cloud shadow
+    255: 0  # No Data
+}
+
+# Original merged OPERA DSWx water values
+WATER_VALS = [1, 2]
+
+# Reclassification of merged OPERA DSWx values before adding connected water
+# Snow/Ice reclassified to avoid conflict with cloud pixel value
+# Partial water reclassified to avoid conflict with connected open water
+RIVER_MAP = {
+    0: 0,  # No data
+    1: 1,  # Open Water
+    2: 3,  # Partial Surface Water (Change value to avoid overlap)
+    252: 252,  # Snow/Ice (Reclassify to Open Water)
+    253: 253,  # Cloud/Cloud shadow
+    255: 255
+}
+
+
+# ******************************************************************************
+# Define reclassification functions
+# ******************************************************************************
+# Create lookup table mapping each 8-bit pixel value to its reclassified value
+# Values missing from the reclassification map are mapped to 0
+def reclass_lut(reclass_map):
+
+    lut = np.zeros(256, dtype=np.uint8)
+    for k, v in reclass_map.items():
+        lut[k] = v
+
+    return lut
+
+
+# Generate windows of horizontal chunks of chunk_size rows of a raster
+def chunk_windows(src, chunk_size):
+
+    for j in range(0, src.height, chunk_size):
+        yield Window(0, j, src.width, min(chunk_size, src.height - j))
+
+
+# Check if an open raster contains any of values, reading it by chunks and
+# stopping at the first chunk containing one of them
+def contains_values(src, values, chunk_size=5000):
+
+    for window in chunk_windows(src, chunk_size):
+        if np.isin(src.read(window=window), values).any():
+            return True
+
+    return False
+
+
+# Reclassify an open raster with a lookup table by chunks of chunk_size rows
+# and write it to dst_fp, updating its profile with profile_update
+def reclass_raster(src, dst_fp, lut, chunk_size=5000, profile_update=None):
+
+    profile = src.profile
+    if profile_update is not None:
+        profile.update(profile_update)
+
+    with rasterio.open(dst_fp, 'w', **profile) as dst:
+        for window in chunk_windows(src, chunk_size):
+
+            # Reclassify pixel values of chunk and write them to file
+            dst.write(np.take(lut, src.read(window=window)), window=window)
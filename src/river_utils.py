@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# river_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains functions used to identify the main river and connected
+# water bodies from clumped OPERA DSWx rasters and SWORD nodes.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import numpy as np
+import shapely
+from rasterio.windows import Window
+from shapely import STRtree
+
+
+# ******************************************************************************
+# Declaration of constants
+# ******************************************************************************
+# Initial search radius (pixels) for the nearest clump of a node
+SEARCH_RADIUS = 16
+
+
+# ******************************************************************************
+# Define clump selection functions
+# ******************************************************************************
+# Retrieve packed array of node coordinates (x, y) and node point geometries
+# built from it, read once and reused for all windows
+def node_arrays(nodes):
+
+    node_xy = shapely.get_coordinates(nodes.geometry.values)
+
+    return node_xy, shapely.points(node_xy)
+
+
+# Retrieve fractional pixel coordinates (rows, columns) of node coordinates
+# (array of x, y) in a raster grid
+def node_pixels(node_xy, transform):
+
+    cols, rows = ~transform * (node_xy[:, 0], node_xy[:, 1])
+
+    return np.asarray(rows, dtype=np.float64), np.asarray(cols,
+                                                           dtype=np.float64)
+
+
+# Retrieve window of the pixels whose centers may lie within radius (pixels)
+# of fractional pixel coordinates, clipped to the raster shape, and whether it
+# covers the whole raster
+def search_window(shape, row, col, radius):
+
+    height, width = shape
+    r0 = max(int(np.floor(row - radius)), 0)
+    r1 = min(int(np.ceil(row + radius)) + 1, height)
+    c0 = max(int(np.floor(col - radius)), 0)
+    c1 = min(int(np.ceil(col + radius)) + 1, width)
+    covers = r0 == 0 and c0 == 0 and r1 == height and c1 == width
+
+    return r0, r1, c0, c1, covers
+
+
+# Retrieve label of the labeled pixel nearest to a node, measured between the
+# node and pixel centers
+# If max_dist (pixels) is 0, the search window grows until a labeled pixel is
+# found; otherwise 0 is returned if no labeled pixel is within max_dist
+def nearest_label(labels, row, col, max_dist=0):
+
+    radius = max_dist if max_dist > 0 else SEARCH_RADIUS
+
+    while True:
+
+        # Retrieve window of pixels whose centers may lie within radius
+        r0, r1, c0, c1, covers = search_window(labels.shape, row, col, radius)
+
+        # Find nearest labeled pixel in window
+        rr, cc = np.nonzero(labels[r0:r1, c0:c1])
+        if len(rr) > 0:
+            dist = np.hypot(rr + r0 + 0.5 - row, cc + c0 + 0.5 - col)
+            k = np.argmin(dist)
+
+            # Pixels outside the window are farther than radius, so the
+            # nearest pixel is final if within radius or if no pixel is outside
+            if dist[k] <= radius or covers:
+                return labels[rr[k] + r0, cc[k] + c0]
+
+        if max_dist > 0 or covers:
+            return 0
+
+        radius *= 2
+
+
+# Retrieve labels of the labeled pixels nearest to a node, measured between the
+# node and pixel squares (0 for the pixel under the node), which is the
+# distance between the node and the clumped polygons made of these squares
+# Labels of all pixels within tol (pixels) of the smallest distance are
+# retrieved, so that no clump tied in distance with the nearest one is missed
+# If max_dist (pixels) is 0, the search window grows until a labeled pixel is
+# found; otherwise no label is retrieved if no labeled pixel is within max_dist
+def nearest_square_labels(labels, row, col, max_dist=0, tol=1e-6):
+
+    radius = max_dist if max_dist > 0 else SEARCH_RADIUS
+
+    while True:
+
+        # Retrieve window of pixels whose squares may lie within radius, so
+        # that squares of pixels outside the window are farther than radius
+        r0, r1, c0, c1, covers = search_window(labels.shape, row, col,
+                                               radius + 1)
+
+        # Find nearest labeled pixels in window
+        rr, cc = np.nonzero(labels[r0:r1, c0:c1])
+        if len(rr) > 0:
+            dr = np.maximum(np.abs(rr + r0 + 0.5 - row) - 0.5, 0)
+            dc = np.maximum(np.abs(cc + c0 + 0.5 - col) - 0.5, 0)
+            dist = np.hypot(dr, dc)
+            d_min = dist.min()
+
+            if d_min + tol <= radius or covers:
+                if max_dist > 0 and d_min > max_dist:
+                    break
+                near = dist <= d_min + tol
+                return np.unique(labels[rr[near] + r0, cc[near] + c0])
+
+        if max_dist > 0 or covers:
+            break
+
+        radius *= 2
+
+    return np.zeros(0, dtype=labels.dtype)
+
+
+# Select labels of clumps under each node, or of the clump nearest to nodes
+# that do not lie on a labeled pixel
+# rows and cols are fractional pixel coordinates of nodes, and max_dist is the
+# search distance (pixels) for the nearest clump, 0 for no limit
+# If squares is True, distances are measured to pixel squares rather than
+# centers, as between nodes and clumped polygons, and all clumps at the
+# smallest distance of a node are selected, so that the selection holds the
+# polygon nearest to each node
+def select_labels(labels, rows, cols, max_dist=0, squares=False):
+
+    if squares:
+        near = [nearest_square_labels(labels, rows[k], cols[k], max_dist)
+                for k in range(len(rows))]
+        return np.unique(np.concatenate(near + [np.zeros(0, labels.dtype)]))
+
+    height, width = labels.shape
+
+    # Retrieve label of pixel under each node
+    r = np.floor(rows).astype(np.int64)
+    c = np.floor(cols).astype(np.int64)
+    inside = (r >= 0) & (r < height) & (c >= 0) & (c < width)
+    node_labels = np.zeros(len(rows), dtype=labels.dtype)
+    node_labels[inside] = labels[r[inside], c[inside]]
+
+    # Search for nearest clump of nodes outside of clumps
+    for k in np.flatnonzero(node_labels == 0):
+        node_labels[k] = nearest_label(labels, rows[k], cols[k], max_dist)
+
+    return np.unique(node_labels[node_labels > 0])
+
+
+# Retrieve mask of the (node, polygon) pairs at the smallest distance of their
+# node
+def nearest_pairs(node_idx, dist, n_nodes):
+
+    node_min = np.full(n_nodes, np.inf)
+    np.minimum.at(node_min, node_idx, dist)
+
+    return dist == node_min[node_idx]
+
+
+# Retrieve position of the polygon nearest to each node, with exact distances
+# computed between geometries for all nodes at once
+# The spatial index is bulk loaded from the polygon geometry array (STR packed)
+# Of polygons at equal distance from a node, the first one is retained
+# If bbox is True, the search is first narrowed to the polygons whose bounding
+# box is nearest to the node, as done by the rtree query used before, and the
+# nearest of them is retained, so that outputs published with that query are
+# reproduced
+def nearest_polygons(node_geoms, poly_geoms, bbox=False):
+
+    # Index polygons, or their bounding boxes
+    if bbox:
+        index_geoms = shapely.box(*shapely.bounds(poly_geoms).T)
+    else:
+        index_geoms = poly_geoms
+    tree = STRtree(index_geoms)
+
+    # Retrieve distance of each node to its nearest indexed geometry, then
+    # candidates slightly beyond it, so that no tie is missed
+    (node_idx, _), dist = tree.query_nearest(node_geoms, return_distance=True)
+    tie_idx, poly_idx = tree.query(node_geoms[node_idx], predicate='dwithin',
+                                   distance=dist * (1 + 1e-9))
+    node_idx = node_idx[tie_idx]
+
+    # Retain candidates at the smallest distance of each node, with distances
+    # to bounding boxes computed from their bounds, so that boxes at the same
+    # distance tie exactly
+    if bbox:
+        xy = shapely.get_coordinates(node_geoms)[node_idx]
+        bounds = shapely.bounds(poly_geoms)[poly_idx]
+        gap = np.maximum(np.maximum(bounds[:, :2] - xy, xy - bounds[:, 2:]), 0)
+        dist = np.hypot(gap[:, 0], gap[:, 1])
+    else:
+        dist = shapely.distance(node_geoms[node_idx], poly_geoms[poly_idx])
+    keep = nearest_pairs(node_idx, dist, len(node_geoms))
+    node_idx, poly_idx = node_idx[keep], poly_idx[keep]
+
+    # Retain polygons at the smallest exact distance among bounding boxes
+    if bbox:
+        dist = shapely.distance(node_geoms[node_idx], poly_geoms[poly_idx])
+        keep = nearest_pairs(node_idx, dist, len(node_geoms))
+        node_idx, poly_idx = node_idx[keep], poly_idx[keep]
+
+    # Retain first polygon of each node
+    near = np.full(len(node_geoms), len(poly_geoms), dtype=np.int64)
+    np.minimum.at(near, node_idx, poly_idx)
+
+    return near
+
+
+# ******************************************************************************
+# Define connected water functions
+# ******************************************************************************
+# Retrieve window bounding the True pixels of a mask, which must have at least
+# one True pixel
+def mask_window(mask):
+
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+
+    return Window(cols[0], rows[0], cols[-1] - cols[0] + 1,
+                  rows[-1] - rows[0] + 1)
+
+
+# Retrieve pixel values of the clumps with selected labels, cropped to the
+# clumps and set to 0 elsewhere, along with the crop window
+# If no clump is selected (no clump under or within max_dist of a node), the
+# values are all 0 over the whole raster
+def connected_water(data, labels, selected):
+
+    con_mask = np.isin(labels, selected)
+    if not con_mask.any():
+        return np.zeros_like(data), Window(0, 0, data.shape[1],
+                                           data.shape[0])
+
+    window = mask_window(con_mask)
+    slices = window.toslices()
+
+    return np.where(con_mask[slices], data[slices], 0), window
+
+
+# Retrieve window of a raster grid covering another grid of the same pixel size,
+# given its transform and shape
+def grid_window(src_transform, transform, shape):
+
+    col_off = int(round((transform.c - src_transform.c) / src_transform.a))
+    row_off = int(round((transform.f - src_transform.f) / src_transform.e))
+
+    return Window(col_off, row_off, shape[1], shape[0])
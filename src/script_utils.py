@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# script_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains helper functions shared by the DSWx-width scripts for
+# handling optional command line arguments, running jobs in worker pools and
+# writing files atomically.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import itertools
+import os
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+
+# ******************************************************************************
+# Define command line functions
+# ******************************************************************************
+# Separate optional arguments (--name value, or --name for True/False options)
+# from positional arguments, casting values to the type of their default
+def get_opts(argv, opts):
+
+    args = []
+    vals = dict(opts)
+
+    i = 0
+    while i < len(argv):
+
+        # Keep positional arguments in order
+        if not argv[i].startswith('--'):
+            args.append(argv[i])
+            i += 1
+            continue
+
+        # Check that option is known
+        name = argv[i][2:].replace('-', '_')
+        if name not in opts:
+            print('ERROR - Unknown option ' + argv[i])
+            raise SystemExit(22)
+
+        # Set True/False options without reading a value
+        if isinstance(opts[name], bool):
+            vals[name] = True
+            i += 1
+            continue
+
+        # Read and cast option value
+        if i + 1 >= len(argv):
+            print('ERROR - Missing value for option ' + argv[i])
+            raise SystemExit(22)
+
+        cast = str if opts[name] is None else type(opts[name])
+        try:
+            vals[name] = cast(argv[i + 1])
+        except ValueError:
+            print('ERROR - Invalid value for option ' + argv[i])
+            raise SystemExit(22)
+        i += 2
+
+    return args, vals
+
+
+# ******************************************************************************
+# Define worker pool functions
+# ******************************************************************************
+# Limit the address space (virtual memory) of the current process to max_mem
+# MB, which counts mapped libraries and files and so exceeds resident memory
+def limit_memory(max_mem):
+
+    hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+    limit = max_mem * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+# Run function over jobs (tuples of arguments), serially or in a process pool,
+# returning results in the order of the jobs
+# If max_mem is set, the address space of each process running jobs (workers,
+# or the current process when run serially) is limited to max_mem MB, and a
+# job exceeding it fails with a MemoryError
+def run_jobs(func, jobs, workers=1, max_mem=0):
+
+    # Run jobs serially in the current process
+    if workers <= 1 or len(jobs) <= 1:
+        if max_mem > 0:
+            limit_memory(max_mem)
+        for result in itertools.starmap(func, jobs):
+            yield result
+        return
+
+    # Set memory limit of workers
+    initializer, initargs = None, ()
+    if max_mem > 0:
+        initializer, initargs = limit_memory, (max_mem,)
+
+    # Fork workers so the calling script is not re-executed in each worker
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('fork'),
+                             initializer=initializer,
+                             initargs=initargs) as pool:
+        for result in pool.map(func, *zip(*jobs)):
+            yield result
+
+
+# ******************************************************************************
+# Define file writing functions
+# ******************************************************************************
+# Retrieve a temporary file path next to fp to write to, renamed to fp once the
+# with block completes, so that an interrupted run or other processes reading
+# the folder never see a partially written file
+# The temporary path is unique to the process and ends with .tmp, so that it
+# is not matched by the extension of fp, and it is removed if the with block
+# fails
+@contextmanager
+def atomic_path(fp):
+
+    tmp_fp = fp + '.' + str(os.getpid()) + '.tmp'
+
+    try:
+        yield tmp_fp
+        os.replace(tmp_fp, fp)
+    finally:
+        if os.path.exists(tmp_fp):
+            os.remove(tmp_fp)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# tst_bench_merge.py
+# ******************************************************************************
+
+# Purpose:
+# Given a tile size, an overlap and a number of tiles per side, time the
+# priority merge of synthetic overlapping OPERA tiles with rasterio.merge, using
+# the per-pixel ranking previously used and the lookup table ranking, and
+# ensure that both mosaics are identical.
+
+# Author:
+# Jeffrey Wade, 2025
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+import numpy as np
+import rasterio
+from rasterio.merge import merge
+from rasterio.transform import from_origin
+from composite_utils import priority_lut
+from merge_utils import priority_merge
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - tile_size
+# 2 - overlap
+# 3 - n_side
+
+
+# ******************************************************************************
+# Get command line arguments
+# ******************************************************************************
+IS_arg = len(sys.argv)
+if IS_arg != 4:
+    print('ERROR - 3 arguments must be used')
+    raise SystemExit(22)
+
+try:
+    tile_size = int(sys.argv[1])
+    overlap = int(sys.argv[2])
+    n_side = int(sys.argv[3])
+except ValueError:
+    print('ERROR - Arguments must be integers')
+    raise SystemExit(22)
+
+
+# ******************************************************************************
+# Set merge options
+# ******************************************************************************
+# Priority of maximum inundation extent, as in SpatialAgg_OPERA.py
+priority = [1, 2, 252, 0, 253, 255]
+priority_rank = priority_lut(priority)
+
+
+# ******************************************************************************
+# Define previous merge function
+# ******************************************************************************
+# Merge rasters based on value priority, ranking each pixel with a dictionary
+def dict_priority_merge(old_data, new_data, old_nodata=None, new_nodata=None,
+                        index=None, roff=None, coff=None):
+
+    # Create a priority ranking: lower values in the list have higher priority
+    rank = {val: k for k, val in enumerate(priority)}
+
+    # Get the ranks of old and new data based on priority
+    old_data_priority = np.vectorize(rank.get)(old_data)
+    new_data_priority = np.vectorize(rank.get)(new_data)
+
+    # Mask to select where new_data should replace old_data
+    replace_mask = new_data_priority < old_data_priority
+
+    # Update old_data where the new_data has higher priority
+    old_data[replace_mask] = new_data[replace_mask]
+
+
+# ******************************************************************************
+# Write synthetic tiles and time merges
+# ******************************************************************************
+rng = np.random.default_rng(0)
+step = tile_size - overlap
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+
+    # Write tiles on a grid of n_side x n_side tiles overlapping by overlap
+    tile_files = []
+    for i in range(n_side):
+        for j in range(n_side):
+            data = rng.choice(np.array(priority, dtype=np.uint8),
+                              size=(tile_size, tile_size))
+            tile_fp = os.path.join(tmp_dir, 'tile_' + str(i) + '_' + str(j) +
+                                   '.tif')
+            with rasterio.open(tile_fp, 'w', driver='GTiff',
+                               height=tile_size, width=tile_size, count=1,
+                               dtype=np.uint8, nodata=255, crs='EPSG:32612',
+                               transform=from_origin(j * step * 30,
+                                                     -i * step * 30, 30,
+                                                     30)) as dst:
+                dst.write(data, 1)
+            tile_files.append(tile_fp)
+
+    # Merge tiles with each merge function
+    mosaics = []
+    for name, method in [('dictionary', dict_priority_merge),
+                         ('lookup table', partial(priority_merge,
+                                                  priority_rank=priority_rank))]:
+        start = time.perf_counter()
+        mosaic, _ = merge(tile_files, method=method)
+        print(name + ' ranking: ' +
+              str(round(time.perf_counter() - start, 1)) + ' s')
+        mosaics.append(mosaic)
+
+print('Mosaic of ' + str(mosaics[0].shape[2]) + ' x ' +
+      str(mosaics[0].shape[1]) + ' pixels')
+if not np.array_equal(mosaics[0], mosaics[1]):
+    print('ERROR - Mosaics differ')
+    raise SystemExit(99)
+print('Mosaics are identical')
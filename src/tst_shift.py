@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# tst_shift.py
+# ******************************************************************************
+
+# Purpose:
+# Given a shapefile, write a copy of it with all features shifted by an offset,
+# so that testing can place features away from the data they are tested on.
+
+# Author:
+# Jeffrey Wade, 2025
+
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import sys
+import geopandas as gpd
+
+
+# ******************************************************************************
+# Declaration of variables (given as command line arguments)
+# ******************************************************************************
+# 1 - shp_in
+# 2 - x_off
+# 3 - y_off
+# 4 - shp_out
+
+
+# ******************************************************************************
+# Get command line arguments
+# ******************************************************************************
+IS_arg = len(sys.argv)
+if IS_arg != 5:
+    print('ERROR - 4 arguments must be used')
+    raise SystemExit(22)
+
+shp_in = sys.argv[1]
+try:
+    x_off = float(sys.argv[2])
+    y_off = float(sys.argv[3])
+except ValueError:
+    print('ERROR - Offsets must be numbers')
+    raise SystemExit(22)
+shp_out = sys.argv[4]
+
+
+# ******************************************************************************
+# Check if files exist
+# ******************************************************************************
+try:
+    with open(shp_in) as file:
+        pass
+except IOError:
+    print('ERROR - Unable to open ' + shp_in)
+    raise SystemExit(22)
+
+
+# ******************************************************************************
+# Shift features and write to file
+# ******************************************************************************
+gdf = gpd.read_file(shp_in)
+gdf['geometry'] = gdf.geometry.translate(x_off, y_off)
+gdf.to_file(shp_out, driver='ESRI Shapefile')
+print('Shifted ' + str(len(gdf)) + ' features')
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# ******************************************************************************
+# width_utils.py
+# ******************************************************************************
+
+# Purpose:
+# This module contains functions used to convert pixel counts of SWORD node
+# Thiessen polygons into river widths.
+# Author:
+# Jeffrey Wade, 2025
+
+# ******************************************************************************
+# Import Python modules
+# ******************************************************************************
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from datetime import datetime
+
+
+# ******************************************************************************
+# Declaration of constants
+# ******************************************************************************
+# Pattern of date windows in file names
+WINDOW_PATTERN = r'(\d{4}-\d{2}-\d{2}_\d{4}-\d{2}-\d{2})'
+
+# Pixel count columns of width files
+WIDTH_COUNT_COLS = ['open_con', 'open_uncon', 'partial_con', 'partial_uncon',
+                    'land', 'cloud', 'icesnow', 'no_data']
+
+# Area of a pixel (m2)
+PIXEL_AREA = 900
+
+# Columns of width files
+WIDTH_COLS = ['node_id', 'reach_id', 'startdate', 'middate', 'enddate',
+              'node_len', 'x', 'y', 'poly_area_km2', 'open_con', 'open_uncon',
+              'partial_con', 'partial_uncon', 'land', 'cloud', 'icesnow',
+              'no_data', 'width_m', 'no_data_frac', 'inun_frac']
+
+# Partitioning of Parquet width stores, by start date of windows and UTM zone
+# (startdate=YYYY-MM-DD/utm=ZZN/ folders)
+WIDTH_PARTITIONING = ds.partitioning(pa.schema([('startdate', pa.string()),
+                                                ('utm', pa.string())]),
+                                     flavor='hive')
+
+
+# ******************************************************************************
+# Define date window functions
+# ******************************************************************************
+# Retrieve date window (start_end) in a file name, or None if missing
+def file_window(fp):
+
+    match = re.search(WINDOW_PATTERN, fp)
+
+    return None if match is None else match.group(1)
+
+
+# Retrieve midpoint date between start and end dates of a date window
+def window_midpoint(window):
+
+    start_date_str, end_date_str = window.split('_')
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+    midpoint = start_date + (end_date - start_date) / 2
+
+    return midpoint.strftime('%Y-%m-%d')
+
+
+# ******************************************************************************
+# Define width functions
+# ******************************************************************************
+# Create table of river widths from a table of pixel counts
+# Dates are given either as strings shared by all rows or as arrays with one
+# value per row, so that pixel counts of several windows are converted at once
+def width_table(pixtable, startdate, middate, enddate):
+
+    # Create new dataframe for widths
+    widtable = pixtable[['node_id', 'reach_id']].copy()
+    widtable['startdate'] = startdate
+    widtable['middate'] = middate
+    widtable['enddate'] = enddate
+    widtable['node_len'] = pixtable.node_len
+    widtable['x'] = pixtable.x
+    widtable['y'] = pixtable.y
+    widtable['poly_area_km2'] = pixtable.Area_Sqkm
+    widtable['open_con'] = pixtable.Connected_Open
+    widtable['open_uncon'] = pixtable.Unconnected_Open
+    widtable['partial_con'] = pixtable.Connected_Partial
+    widtable['partial_uncon'] = pixtable.Unconnected_Partial
+    widtable['land'] = pixtable.Land
+    widtable['cloud'] = pixtable.Clouds
+    widtable['icesnow'] = pixtable.IceSnow
+    widtable['no_data'] = pixtable.No_Data
+
+    # Convert connected pixel count to area in m2
+    # Partially inundated pixels counted as half area
+    open_area = widtable.open_con * PIXEL_AREA  # Fully inundated area
+    partial_area = widtable.partial_con * PIXEL_AREA  # Partially inundated
+
+    # Calculate river width in meters at node, node_len in meters
+    widtable['width_m'] = (open_area + (0.5 * partial_area)) /\
+        widtable.node_len
+
+    # Calculate fraction of polygon with no data/clouds
+    widtable['no_data_frac'] = ((widtable['no_data'] + widtable['cloud']) /
+                                (widtable['open_con'] +
+                                 widtable['open_uncon'] +
+                                 widtable['partial_con'] +
+                                 widtable['partial_uncon'] +
+                                 widtable['land'] +
+                                 widtable['cloud'] +
+                                 widtable['icesnow'] +
+                                 widtable['no_data']))
+
+    # Calculate polygon inundation fraction of each polygon
+    widtable['inun_frac'] = (open_area + (0.5 * partial_area)) /\
+        (widtable.poly_area_km2 * 1000000)
+
+    # Round floats
+    widtable = widtable.round({'width_m': 4, 'no_data_frac': 4,
+                               'inun_frac': 4})
+
+    return widtable
+
+
+# ******************************************************************************
+# Define Parquet width store functions
+# ******************************************************************************
+# Write width table of a UTM zone into a Parquet store partitioned by start
+# date and UTM zone, with node and reach ids and pixel counts stored as int64,
+# so that all windows share one schema whether their counts were read as
+# integers or as floats
+# Partitions of the UTM zone and windows of the table are replaced if they
+# already exist, so widths of a zone can be written again
+def write_width_store(widtable, store_dir, utm_str):
+
+    widtable = widtable.astype({'node_id': np.int64, 'reach_id': np.int64,
+                                **{c: np.int64 for c in WIDTH_COUNT_COLS}})
+    table = pa.Table.from_pandas(widtable.assign(utm=utm_str),
+                                 preserve_index=False)
+
+    ds.write_dataset(table, store_dir, format='parquet',
+                     partitioning=WIDTH_PARTITIONING,
+                     basename_template='part-{i}.parquet',
+                     existing_data_behavior='delete_matching')
+
+
+# Read columns of width tables from a Parquet width store, keeping only rows
+# matching row_filter (a pyarrow.dataset expression), pushed down to skip
+# partitions and row groups
+def read_width_store(store_dir, columns=WIDTH_COLS, row_filter=None):
+
+    dataset = ds.dataset(store_dir, format='parquet',
+                         partitioning=WIDTH_PARTITIONING)
+
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+
+# Retrieve date windows (start, middle and end dates) of a Parquet width store,
+# sorted by start date
+def store_windows(store_dir):
+
+    dates = read_width_store(store_dir, ['startdate', 'middate', 'enddate'])
+
+    return dates.drop_duplicates().sort_values('startdate') \
+        .reset_index(drop=True)
+
+
+# ******************************************************************************
+# Define width aggregation functions
+# ******************************************************************************
+# Split a width file of all windows of a UTM zone (without a window in its
+# name) into one csv file per window, named from split_prefix, in a single
+# pass reading it by chunks of chunk_size rows
+# Returns a dictionary of the split file of each window of the width file
+def split_windows(width_fp, split_prefix, chunk_size=100000):
+
+    split_files = {}
+    for chunk in pd.read_csv(width_fp, chunksize=chunk_size):
+        for (start, end), group in chunk.groupby(['startdate', 'enddate'],
+                                                 sort=False):
+            window = start + '_' + end
+            new = window not in split_files
+            if new:
+                split_files[window] = split_prefix + window + '.csv'
+            group.to_csv(split_files[window], mode='w' if new else 'a',
+                         header=new, index=False)
+
+    return split_files
+
+
+# Group width files by date window in a single pass over the sorted files
+# Files of all windows of a UTM zone (without a window in their name) are
+# replaced by their file of each window, given in split_files by split_windows
+# Returns a dictionary of the files of each window, in the order of width_files
+def group_windows(width_files, split_files):
+
+    window_files = {}
+    for x in width_files:
+        window = file_window(x)
+        if window is not None:
+            window_files.setdefault(window, []).append(x)
+        else:
+            for window, split_fp in split_files[x].items():
+                window_files.setdefault(window, []).append(split_fp)
+
+    return window_files
+
+
+# Write the width files of a date window to csv_fp, appending one file at a
+# time so that only one file is held in memory
+def append_window(width_files, csv_fp):
+
+    mode = 'w'
+    for x in width_files:
+        pd.read_csv(x).to_csv(csv_fp, mode=mode, header=(mode == 'w'),
+                              index=False)
+        mode = 'a'
+
+    return csv_fp
+
+
+# Write the rows of a date window (given by its start date) of a Parquet width
+# store to csv_fp, reading only the partitions of the window
+def store_window(store_dir, startdate, csv_fp):
+
+    widtable = read_width_store(store_dir,
+                                row_filter=ds.field('startdate') == startdate)
+    widtable.to_csv(csv_fp, index=False)
+
+    return csv_fp
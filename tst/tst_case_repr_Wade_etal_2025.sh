@@ -34,7 +34,7 @@ echo "********************"
 #Select which unit tests to perform based on inputs to this shell script
 #*****************************************************************************
 #Perform all unit tests if no options are given
-tot=22
+tot=30
 if [ "$#" = "0" ]; then
      fst=1
      lst=$tot
@@ -252,6 +252,92 @@ echo "********************"
 fi
 
 
+#*****************************************************************************
+#Temporally aggregate OPERA tiles by blocks with parallel workers
+#*****************************************************************************
+unt=$((unt+1))
+if (("$unt" >= "$fst")) && (("$unt" <= "$lst")) ; then
+echo "Running unit test $unt/$tot"
+
+run_file=tmp_run_$unt.txt
+cmp_file=tmp_cmp_$unt.txt
+
+mkdir -p "../output_test/opera/temp_agg_blocks"
+
+echo "- Aggregating OPERA tiles by blocks"
+../src/TempAgg_OPERA.py                                                        \
+    ../output_testing/opera/conf_reclass/                                      \
+    "2023-07-01"                                                               \
+    "2024-10-19"                                                               \
+    14                                                                         \
+    ../output_test/opera/temp_agg_blocks/                                      \
+    --blocks                                                                   \
+    --workers 2                                                                \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Comparing Aggregated CONF files (.tif)"
+../src/tst_cmp.py                                                              \
+    ../output_testing/opera/temp_agg/opera_T12TVQ_2024-07-13_2024-07-27.tif    \
+    ../output_test/opera/temp_agg_blocks/opera_T12TVQ_2024-07-13_2024-07-27.tif\
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
+rm -f $cmp_file
+rm -f $run_file
+echo "Success"
+echo "********************"
+fi
+
+
+#*****************************************************************************
+#Temporally aggregate OPERA tiles again, skipping unchanged tiles
+#*****************************************************************************
+unt=$((unt+1))
+if (("$unt" >= "$fst")) && (("$unt" <= "$lst")) ; then
+echo "Running unit test $unt/$tot"
+
+run_file=tmp_run_$unt.txt
+cmp_file=tmp_cmp_$unt.txt
+
+mkdir -p "../output_test/opera/temp_agg_resume"
+
+echo "- Aggregating OPERA tiles and writing manifests"
+../src/TempAgg_OPERA.py                                                        \
+    ../output_testing/opera/conf_reclass/                                      \
+    "2023-07-01"                                                               \
+    "2024-10-19"                                                               \
+    14                                                                         \
+    ../output_test/opera/temp_agg_resume/                                      \
+    --resume                                                                   \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Aggregating OPERA tiles again from manifests"
+../src/TempAgg_OPERA.py                                                        \
+    ../output_testing/opera/conf_reclass/                                      \
+    "2023-07-01"                                                               \
+    "2024-10-19"                                                               \
+    14                                                                         \
+    ../output_test/opera/temp_agg_resume/                                      \
+    --resume                                                                   \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Comparing Aggregated CONF files (.tif)"
+../src/tst_cmp.py                                                              \
+    ../output_testing/opera/temp_agg/opera_T12TVQ_2024-07-13_2024-07-27.tif    \
+    ../output_test/opera/temp_agg_resume/opera_T12TVQ_2024-07-13_2024-07-27.tif\
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
+rm -f $cmp_file
+rm -f $run_file
+echo "Success"
+echo "********************"
+fi
+
+
 #*****************************************************************************
 #Identify overlap between OPERA tiles and UTM Zones
 #*****************************************************************************
@@ -322,6 +408,43 @@ echo "********************"
 fi
 
 
+#*****************************************************************************
+#Spatially merge OPERA tiles by chunks with parallel workers
+#*****************************************************************************
+unt=$((unt+1))
+if (("$unt" >= "$fst")) && (("$unt" <= "$lst")) ; then
+echo "Running unit test $unt/$tot"
+
+run_file=tmp_run_$unt.txt
+cmp_file=tmp_cmp_$unt.txt
+
+mkdir -p "../output_test/opera/merge_lazy"
+
+echo "- Merging OPERA tiles by chunks"
+../src/SpatialAgg_OPERA.py                                                     \
+    ../output_testing/opera/temp_agg/                                          \
+    ../output_testing/opera/utm_overlap/opera_utm_overlap.csv                  \
+    ${utm}                                                                     \
+    ../output_test/opera/merge_lazy/                                           \
+    --lazy                                                                     \
+    --workers 2                                                                \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Comparing Merged OPERA tiles (.tif)"
+../src/tst_cmp.py                                                              \
+    ../output_testing/opera/merge/opera_12N_2024-07-13_2024-07-27.tif          \
+    ../output_test/opera/merge_lazy/opera_12N_2024-07-13_2024-07-27.tif        \
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
+rm -f $cmp_file
+rm -f $run_file
+echo "Success"
+echo "********************"
+fi
+
+
 #*****************************************************************************
 #Reclassify and clump similar pixels
 #*****************************************************************************
@@ -372,6 +495,51 @@ echo "********************"
 fi
 
 
+#*****************************************************************************
+#Reclassify and clump similar pixels by blocks
+#*****************************************************************************
+unt=$((unt+1))
+if (("$unt" >= "$fst")) && (("$unt" <= "$lst")) ; then
+echo "Running unit test $unt/$tot"
+
+run_file=tmp_run_$unt.txt
+cmp_file=tmp_cmp_$unt.txt
+
+mkdir -p "../output_test/opera/clump_blocks/reclass"
+mkdir -p "../output_test/opera/clump_blocks/clumpedras_poly"
+
+echo "- Clumping similar pixels by blocks"
+../src/Clump.py                                                                \
+    ../output_testing/opera/merge/                                             \
+    ../output_testing/sword/voronoi/clipped_voronoi_utm${utm}.shp              \
+    ${utm}                                                                     \
+    ../output_test/opera/clump_blocks/                                         \
+    --block-size 1024                                                          \
+    --workers 2                                                                \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Comparing Clumped reclassified tiles (.tif)"
+../src/tst_cmp.py                                                              \
+    ../output_testing/opera/clump/reclass/opera_12N_2024-07-13_2024-07-27_reclassified.tif\
+    ../output_test/opera/clump_blocks/reclass/opera_12N_2024-07-13_2024-07-27_reclassified.tif\
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
+echo "- Comparing Clumped shapefiles (.shp)"
+../src/tst_cmp.py                                                              \
+    ../output_testing/opera/clump/clumpedras_poly/opera_12N_2024-07-13_2024-07-27_clumpedRas_poly.shp\
+    ../output_test/opera/clump_blocks/clumpedras_poly/opera_12N_2024-07-13_2024-07-27_clumpedRas_poly.shp\
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
+rm -f $cmp_file
+rm -f $run_file
+echo "Success"
+echo "********************"
+fi
+
+
 #*****************************************************************************
 #Create the main river from clumped tif
 #*****************************************************************************
@@ -394,6 +562,8 @@ echo "- Creating main river"
     ../output_testing/opera/merge/                                             \
     ${utm}                                                                     \
     ../output_test/opera/conwater/                                             \
+    --debug                                                                    \
+    --bbox-nearest                                                             \
     > $run_file
 x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
 
@@ -460,6 +630,53 @@ echo "********************"
 fi
 
 
+#*****************************************************************************
+#Extract pixel classes for thiessen polygons with cached zones
+#*****************************************************************************
+unt=$((unt+1))
+if (("$unt" >= "$fst")) && (("$unt" <= "$lst")) ; then
+echo "Running unit test $unt/$tot"
+
+run_file=tmp_run_$unt.txt
+cmp_file=tmp_cmp_$unt.txt
+
+mkdir -p "../output_test/opera/pixel_num_cache"
+mkdir -p "../output_test/opera/zone_cache"
+
+echo "- Extracting pixel classes and caching zones"
+../src/PixelClassSummary.py                                                    \
+    ../output_testing/opera/conwater/main_river/                               \
+    ../output_testing/sword/voronoi/clipped_voronoi_utm${utm}.shp              \
+    ${utm}                                                                     \
+    ../output_test/opera/pixel_num_cache/                                      \
+    --zone-cache ../output_test/opera/zone_cache/                              \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Extracting pixel classes from cached zones"
+../src/PixelClassSummary.py                                                    \
+    ../output_testing/opera/conwater/main_river/                               \
+    ../output_testing/sword/voronoi/clipped_voronoi_utm${utm}.shp              \
+    ${utm}                                                                     \
+    ../output_test/opera/pixel_num_cache/                                      \
+    --zone-cache ../output_test/opera/zone_cache/                              \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Comparing pixel number files (.csv)"
+../src/tst_cmp.py                                                              \
+    ../output_testing/opera/pixel_num/opera_12N_2024-07-13_2024-07-27_pixel_nums_thiessen.csv\
+    ../output_test/opera/pixel_num_cache/opera_12N_2024-07-13_2024-07-27_pixel_nums_thiessen.csv\
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
+rm -f $cmp_file
+rm -f $run_file
+echo "Success"
+echo "********************"
+fi
+
+
 #*****************************************************************************
 #Calculate river widths for thiessen polygons by UTM zone
 #*****************************************************************************
@@ -527,6 +744,89 @@ echo "********************"
 fi
 
 
+#*****************************************************************************
+#Combine width files by date window in a single pass
+#*****************************************************************************
+unt=$((unt+1))
+if (("$unt" >= "$fst")) && (("$unt" <= "$lst")) ; then
+echo "Running unit test $unt/$tot"
+
+run_file=tmp_run_$unt.txt
+cmp_file=tmp_cmp_$unt.txt
+
+mkdir -p "../output_test/opera/width_stream"
+
+echo "- Combining river width files in a single pass"
+../src/WidthAggregation.py                                                     \
+    ../output_testing/opera/width_utm/                                         \
+    ../output_test/opera/width_stream/                                         \
+    --stream                                                                   \
+    --workers 2                                                                \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Comparing combined river width files (.csv)"
+../src/tst_cmp.py                                                              \
+    ../output_testing/opera/width/opera_2024-07-13_2024-07-27_river_width.csv  \
+    ../output_test/opera/width_stream/opera_2024-07-13_2024-07-27_river_width.csv\
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
+rm -f $cmp_file
+rm -f $run_file
+echo "Success"
+echo "********************"
+fi
+
+
+#*****************************************************************************
+#Calculate river widths of all windows at once and combine them
+#*****************************************************************************
+unt=$((unt+1))
+if (("$unt" >= "$fst")) && (("$unt" <= "$lst")) ; then
+echo "Running unit test $unt/$tot"
+
+run_file=tmp_run_$unt.txt
+cmp_file=tmp_cmp_$unt.txt
+
+mkdir -p "../output_test/opera/width_utm_batch"
+mkdir -p "../output_test/opera/width_batch"
+
+echo "- Copying river width files of other UTM zones"
+cp ../output_testing/opera/width_utm/*.csv ../output_test/opera/width_utm_batch/
+rm -f ../output_test/opera/width_utm_batch/*_${utm}_*
+
+echo "- Calculating river widths of all windows at once"
+../src/ThiessenWidthExtraction.py                                              \
+    ../output_testing/opera/pixel_num/                                         \
+    ${utm}                                                                     \
+    ../output_test/opera/width_utm_batch/                                      \
+    --batch                                                                    \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Combining river width files in a single pass"
+../src/WidthAggregation.py                                                     \
+    ../output_test/opera/width_utm_batch/                                      \
+    ../output_test/opera/width_batch/                                          \
+    --stream                                                                   \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Comparing combined river width files (.csv)"
+../src/tst_cmp.py                                                              \
+    ../output_testing/opera/width/opera_2024-07-13_2024-07-27_river_width.csv  \
+    ../output_test/opera/width_batch/opera_2024-07-13_2024-07-27_river_width.csv\
+    > $cmp_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed comparison: $cmp_file" >&2 ; exit $x ; fi
+
+rm -f $cmp_file
+rm -f $run_file
+echo "Success"
+echo "********************"
+fi
+
+
 #*****************************************************************************
 #Convert SWOT PIXCVec Point Cloud NetCDF to Shapefile
 #*****************************************************************************
@@ -831,6 +1131,48 @@ echo "********************"
 fi
 
 
+#*****************************************************************************
+#Run window pipeline with no clump near any node
+#*****************************************************************************
+unt=$((unt+1))
+if (("$unt" >= "$fst")) && (("$unt" <= "$lst")) ; then
+echo "Running unit test $unt/$tot"
+
+run_file=tmp_run_$unt.txt
+
+mkdir -p "../output_test/opera/pipeline_far"
+
+echo "- Shifting target nodes away from all clumps"
+../src/tst_shift.py                                                            \
+    ../output_testing/sword/nodes/target_nodes_utm${utm}.shp                   \
+    1000000                                                                    \
+    1000000                                                                    \
+    ../output_test/opera/pipeline_far/target_nodes_far_utm${utm}.shp           \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Running window pipeline"
+../src/WindowPipeline.py                                                       \
+    ../output_testing/opera/temp_agg/                                          \
+    ../output_testing/opera/utm_overlap/opera_utm_overlap.csv                  \
+    ${utm}                                                                     \
+    ../output_testing/sword/voronoi/clipped_voronoi_utm${utm}.shp              \
+    ../output_test/opera/pipeline_far/target_nodes_far_utm${utm}.shp           \
+    ../output_test/opera/pipeline_far/                                         \
+    --max-dist 30                                                              \
+    > $run_file
+x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
+
+echo "- Checking pixel number file (.csv)"
+csv_file=../output_test/opera/pipeline_far/opera_12N_2024-07-13_2024-07-27_pixel_nums_thiessen.csv
+if [ ! -f $csv_file ] ; then echo "Missing file: $csv_file" >&2 ; exit 22 ; fi
+
+rm -f $run_file
+echo "Success"
+echo "********************"
+fi
+
+
 #*****************************************************************************
 #Clean up
 #*****************************************************************************
@@ -345,6 +345,7 @@ for ((i = 0; i < ${#utm[@]}; i++)); do
         ../output_test/opera/merge/                                            \
         ${utm[i]}                                                              \
         ../output_test/opera/conwater/                                         \
+        --bbox-nearest                                                         \
         > $run_file
     x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
     
@@ -675,6 +676,9 @@ run_file=tmp_run_$unt.txt
 echo "- Plotting SWOT and OPERA node comparisons"
 ../src/Node_Comp_Plots.py                                                      \
     ../output_test/opera/swot_comp/opera_swot_comp_2023-07-01to2024-10-19.csv  \
+    ../output_test/swot/swot_nodes_2023-07-01to2024-10-19.csv                  \
+    ../output_test/swot/swot_nodes_2023-07-01to2024-10-19_bit_qual.csv         \
+    ../output_test/opera/width/                                                \
     > $run_file
 x=$? && if [ $x -gt 0 ] ; then echo "Failed run: $run_file" >&2 ; exit $x ; fi
 